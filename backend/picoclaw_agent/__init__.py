@@ -6,7 +6,7 @@ A lightweight AI agent framework with multi-provider support and executable tool
 """
 
 from .agent import PicoClawAgent, ContextBuilder, create_default_agent
-from .providers import LLMProviderRegistry, AnthropicProvider, OpenAIProvider
+from .providers import LLMProviderRegistry, AnthropicProvider, OpenAIProvider, ProviderError
 from .tools import ToolRegistry, ShellTool, FileSystemTool, WebSearchTool
 
 __version__ = "1.0.0"
@@ -17,6 +17,7 @@ __all__ = [
     "LLMProviderRegistry",
     "AnthropicProvider",
     "OpenAIProvider",
+    "ProviderError",
     "ToolRegistry",
     "ShellTool",
     "FileSystemTool",
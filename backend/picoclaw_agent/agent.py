@@ -3,11 +3,15 @@ PicoClaw Agent - Main agent implementation
 Handles conversation loop, tool execution, and context building
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
 from pathlib import Path
 from datetime import datetime
+from dataclasses import dataclass
+import asyncio
+import logging
 import platform
 import json
+import httpx
 
 import sys
 import os
@@ -16,130 +20,259 @@ _parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if _parent_dir not in sys.path:
     sys.path.insert(0, _parent_dir)
 
-from picoclaw_agent.providers import LLMProvider, Message, ToolCall
+from picoclaw_agent.providers import (
+    LLMProvider, LLMResponse, ProviderError, Message, ToolCall, UsageInfo,
+    TextDelta, ToolCallComplete, UsageFinal
+)
 from picoclaw_agent.tools import ToolRegistry
 
+logger = logging.getLogger(__name__)
 
-class ContextBuilder:
-    """Builds system context and prompts for the agent"""
+BOOTSTRAP_FILES = ("IDENTITY.md", "SOUL.md", "USER.md", "AGENTS.md")
+MEMORY_TAIL_BYTES = 2000
 
-    def __init__(self, workspace: str, tool_registry: ToolRegistry):
-        self.workspace = Path(workspace)
-        self.tool_registry = tool_registry
+# Identity prompt template, split around the per-builder values
+_IDENTITY_HEAD = """# picoclaw 🦞 (Python Implementation)
 
-        # Ensure workspace exists
-        self.workspace.mkdir(parents=True, exist_ok=True)
+You are picoclaw, a helpful AI assistant integrated into the OpenClaw MGS Codec Dashboard.
 
-        # Create memory directory
-        (self.workspace / "memory").mkdir(exist_ok=True)
+"""
+_IDENTITY_RUNTIME = "## Runtime\n"
+_IDENTITY_WORKSPACE = "\n\n## Workspace\nYour workspace is at: "
+_IDENTITY_MEMORY = "\n- Memory: "
+_IDENTITY_SESSIONS = "/memory/MEMORY.md\n- Sessions: Managed by MongoDB\n\n"
+_IDENTITY_RULES = """
 
-    def get_identity(self) -> str:
-        """Get the core identity prompt"""
-        now = datetime.now().strftime("%Y-%m-%d %H:%M (%A)")
-        workspace_path = self.workspace.resolve()
-        runtime_info = f"{platform.system()} {platform.machine()}, Python"
+## Important Rules
 
-        # Build tools section
-        tools_section = self.build_tools_section()
+1. **ALWAYS use tools** - When you need to perform an action (execute commands, read/write files, search the web, etc.), you MUST call the appropriate tool. Do NOT just say you'll do it or pretend to do it.
 
-        return f"""# picoclaw 🦞 (Python Implementation)
+2. **Be helpful and accurate** - When using tools, briefly explain what you're doing.
 
-You are picoclaw, a helpful AI assistant integrated into the OpenClaw MGS Codec Dashboard.
+3. **Memory** - When remembering something important, use the memory tool to write to """
+_IDENTITY_TAIL = """/memory/MEMORY.md
 
-## Current Time
-{now}
+4. **Security** - You operate in a sandboxed environment. Dangerous commands are blocked for safety.
+"""
 
-## Runtime
-{runtime_info}
 
-## Workspace
-Your workspace is at: {workspace_path}
-- Memory: {workspace_path}/memory/MEMORY.md
-- Sessions: Managed by MongoDB
+@dataclass
+class SystemContext:
+    """System prompt split by how often each part changes"""
+    # Identity, tools and bootstrap files; changes only with the workspace or tools
+    static: str
+    # Current time and memory; changes between turns
+    dynamic: str
 
-{tools_section}
+    def to_messages(self) -> List[Message]:
+        """System messages for the conversation, with the static prefix marked cacheable"""
+        messages = [Message(role="system", content=self.static, cache=True)]
+        if self.dynamic:
+            messages.append(Message(role="system", content=self.dynamic, cache=False))
+        return messages
 
-## Important Rules
 
-1. **ALWAYS use tools** - When you need to perform an action (execute commands, read/write files, search the web, etc.), you MUST call the appropriate tool. Do NOT just say you'll do it or pretend to do it.
+@dataclass
+class _ContextCache:
+    """
+    (key, content) caches for one workspace, invalidated by file mtimes and
+    the registered tools
 
-2. **Be helpful and accurate** - When using tools, briefly explain what you're doing.
+    Shared by every ContextBuilder on the same workspace: agents are created
+    per message, so per-builder caches would never be hit twice.
+    """
+    bootstrap: Optional[Tuple[Tuple[Tuple[str, int], ...], str]] = None
+    memory: Optional[Tuple[int, str]] = None
+    tools_section: Optional[Tuple[Tuple[Tuple[str, type], ...], str]] = None
+    # Last static prompt handed out, to notice when the cached prefix changes
+    last_static: Optional[str] = None
 
-3. **Memory** - When remembering something important, use the memory tool to write to {workspace_path}/memory/MEMORY.md
 
-4. **Security** - You operate in a sandboxed environment. Dangerous commands are blocked for safety.
-"""
+# Resolved workspace path -> its context cache
+_CONTEXT_CACHES: Dict[str, _ContextCache] = {}
+
+
+class ContextBuilder:
+    """Builds system context and prompts for the agent"""
+
+    def __init__(self, workspace: str, tool_registry: ToolRegistry):
+        self.workspace = Path(workspace)
+        self.tool_registry = tool_registry
+
+        # Ensure workspace exists
+        self.workspace.mkdir(parents=True, exist_ok=True)
+
+        # Create memory directory
+        (self.workspace / "memory").mkdir(exist_ok=True)
+
+        # Fixed for the lifetime of the builder
+        self._runtime_info = f"{platform.system()} {platform.machine()}, Python"
+        self._workspace_str = str(self.workspace.resolve())
+
+        cache = _CONTEXT_CACHES.get(self._workspace_str)
+        if cache is None:
+            cache = _CONTEXT_CACHES[self._workspace_str] = _ContextCache()
+        self._cache = cache
+
+        # Plain string paths, so reads don't build Path objects per call
+        workspace_path = str(self.workspace)
+        self._workspace_path = workspace_path
+        self._memory_path = os.path.join(workspace_path, "memory", "MEMORY.md")
+        self._bootstrap_paths = {name: os.path.join(workspace_path, name) for name in BOOTSTRAP_FILES}
+
+    def _identity_body(self) -> str:
+        """Identity prompt sections that follow the current time"""
+        return "".join([
+            _IDENTITY_RUNTIME, self._runtime_info,
+            _IDENTITY_WORKSPACE, self._workspace_str,
+            _IDENTITY_MEMORY, self._workspace_str,
+            _IDENTITY_SESSIONS, self.build_tools_section(),
+            _IDENTITY_RULES, self._workspace_str,
+            _IDENTITY_TAIL,
+        ])
+
+    def get_current_time(self) -> str:
+        """Get the current time section"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M (%A)")
+        return f"## Current Time\n{now}"
+
+    def get_identity(self) -> str:
+        """Get the core identity prompt"""
+        return "".join([_IDENTITY_HEAD, self.get_current_time(), "\n\n", self._identity_body()])
 
     def build_tools_section(self) -> str:
-        """Build the tools section of the identity"""
+        """Build the tools section of the identity, rebuilt only when tools change"""
+        # Keyed on the tools themselves rather than the registry's version,
+        # since each agent brings its own registry
+        key = tuple((name, type(tool)) for name, tool in self.tool_registry.tools.items())
+        cached = self._cache.tools_section
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
         summaries = self.tool_registry.get_summaries()
         if not summaries:
-            return ""
-
-        tools_text = "## Available Tools\n\n"
-        tools_text += "**CRITICAL**: You MUST use tools to perform actions. Do NOT pretend to execute commands or operations.\n\n"
-        tools_text += "You have access to the following tools:\n\n"
-        tools_text += "\n".join(summaries)
-
+            tools_text = ""
+        else:
+            tools_text = "## Available Tools\n\n"
+            tools_text += "**CRITICAL**: You MUST use tools to perform actions. Do NOT pretend to execute commands or operations.\n\n"
+            tools_text += "You have access to the following tools:\n\n"
+            tools_text += "\n".join(summaries)
+
+        self._cache.tools_section = (key, tools_text)
         return tools_text
 
     def load_bootstrap_files(self) -> str:
         """Load bootstrap configuration files from workspace"""
-        bootstrap_files = ["IDENTITY.md", "SOUL.md", "USER.md", "AGENTS.md"]
+        # Collect mtimes with a single directory scan; reuse the cached
+        # content while none of the bootstrap files changed
+        mtimes: Dict[str, int] = {}
+        with os.scandir(self._workspace_path) as entries:
+            for entry in entries:
+                if entry.name in BOOTSTRAP_FILES and entry.is_file():
+                    mtimes[entry.name] = entry.stat().st_mtime_ns
+
+        key = tuple((name, mtimes[name]) for name in BOOTSTRAP_FILES if name in mtimes)
+        cached = self._cache.bootstrap
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
         parts: List[str] = []
 
-        for filename in bootstrap_files:
-            file_path = self.workspace / filename
-            if file_path.exists():
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        parts.append(f"## {filename}\n\n{content}\n\n")
-                except Exception as e:
-                    continue
+        for filename, _ in key:
+            try:
+                with open(self._bootstrap_paths[filename], 'rb') as f:
+                    content = f.read().decode('utf-8')
+            except (OSError, UnicodeDecodeError):
+                continue
+            parts.append(f"## {filename}\n\n{content}\n\n")
 
-        return "".join(parts)
+        bootstrap = "".join(parts)
+        self._cache.bootstrap = (key, bootstrap)
+        return bootstrap
 
     def get_memory_context(self) -> str:
         """Get recent memory context"""
-        memory_file = self.workspace / "memory" / "MEMORY.md"
-
-        if not memory_file.exists():
-            return ""
+        memory_file = self._memory_path
 
         try:
-            with open(memory_file, 'r', encoding='utf-8') as f:
-                content = f.read()
+            stat = os.stat(memory_file)
+        except OSError:
+            return ""
+        mtime = stat.st_mtime_ns
 
-            # Return last 2000 characters to avoid context overflow
-            content_str: str = str(content)
-            if len(content_str) > 2000:
-                # pyre-ignore
-                content_str = "...\n" + content_str[-2000:]
+        cached = self._cache.memory
+        if cached is not None:
+            if cached[0] == mtime:
+                return cached[1]
+            logger.info("MEMORY.md changed; refreshing the dynamic context (static prefix unaffected)")
 
-            return f"## Recent Memory\n\n{content_str}"
+        try:
+            # Only read the last MEMORY_TAIL_BYTES to avoid context overflow;
+            # the file grows with every append, so never read all of it
+            truncated = stat.st_size > MEMORY_TAIL_BYTES
+            with open(memory_file, 'rb') as f:
+                if truncated:
+                    f.seek(stat.st_size - MEMORY_TAIL_BYTES)
+                tail = f.read(MEMORY_TAIL_BYTES)
+
+            # Skip UTF-8 continuation bytes so we don't start mid-character
+            start = 0
+            if truncated:
+                while start < len(tail) and (tail[start] & 0xC0) == 0x80:
+                    start += 1
+
+            content_str = tail[start:].decode('utf-8', errors='replace')
+            if truncated:
+                content_str = "...\n" + content_str
+
+            memory_context = f"## Recent Memory\n\n{content_str}"
 
         except Exception:
             return ""
 
-    def build_system_prompt(self) -> str:
-        """Build the complete system prompt"""
-        parts = []
+        self._cache.memory = (mtime, memory_context)
+        return memory_context
+
+    def build_system_prompt(self) -> SystemContext:
+        """
+        Build the complete system prompt
 
+        The static part (identity, tools, bootstrap files) only changes when the
+        workspace or tools change, so it can be served from the provider's prompt
+        cache; the current time and memory go in the dynamic part so they don't
+        invalidate that prefix.
+        """
         # Core identity
-        parts.append(self.get_identity())
+        static_parts = [_IDENTITY_HEAD + self._identity_body()]
 
         # Bootstrap files
         bootstrap_content = self.load_bootstrap_files()
         if bootstrap_content:
-            parts.append("---\n\n" + bootstrap_content)
+            static_parts.append("---\n\n" + bootstrap_content)
+
+        dynamic_parts = [self.get_current_time()]
 
         # Memory
         memory_context = self.get_memory_context()
         if memory_context:
-            parts.append("---\n\n" + memory_context)
+            dynamic_parts.append("---\n\n" + memory_context)
 
-        return "\n".join(parts)
+        context = SystemContext(static="\n".join(static_parts), dynamic="\n".join(dynamic_parts))
+
+        if self._cache.last_static is not None and context.static != self._cache.last_static:
+            logger.info("Static system prompt changed; the cached prompt prefix is invalidated")
+        self._cache.last_static = context.static
+
+        logger.debug(
+            "System context: static %d chars (identity, tools v%d, bootstrap %s), "
+            "dynamic %d chars (time, memory %s)",
+            len(context.static),
+            self.tool_registry.version,
+            [name for name, _ in self._cache.bootstrap[0]] if self._cache.bootstrap else [],
+            len(context.dynamic),
+            "yes" if memory_context else "none"
+        )
+        return context
 
 
 class PicoClawAgent:
@@ -151,7 +284,8 @@ class PicoClawAgent:
         tool_registry: ToolRegistry,
         workspace: str,
         model: Optional[str] = None,
-        max_iterations: int = 10
+        max_iterations: int = 10,
+        max_concurrency: int = 8
     ):
         self.provider = provider
         self.tool_registry = tool_registry
@@ -160,15 +294,22 @@ class PicoClawAgent:
         self.max_iterations = max_iterations
         self.context_builder = ContextBuilder(workspace, tool_registry)
 
+        # Bounds how many tool calls from a single turn run at once
+        self._tool_semaphore = asyncio.Semaphore(max_concurrency)
+
     async def chat(
         self,
         user_message: str,
         history: Optional[List[Message]] = None,
-        agent_context: Optional[Dict[str, Any]] = None
+        agent_context: Optional[Dict[str, Any]] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
         """
         Process a chat message and return the response
 
+        If on_delta is given, it is awaited with each text fragment as the
+        LLM streams it, across all iterations of the turn.
+
         Returns:
             {
                 "content": str,
@@ -182,9 +323,8 @@ class PicoClawAgent:
         # Build messages
         messages = []
 
-        # Add system prompt
-        system_prompt = self.context_builder.build_system_prompt()
-        messages.append(Message(role="system", content=system_prompt))
+        # Add system prompt: cacheable static prefix, then the dynamic context
+        messages.extend(self.context_builder.build_system_prompt().to_messages())
 
         # Add history if provided
         if history:
@@ -197,17 +337,24 @@ class PicoClawAgent:
         iterations = 0
         tool_results_log = []
         final_content = ""
+        error = None
         total_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
         while iterations < self.max_iterations:
             iterations += 1
 
-            # Get LLM response
-            response = await self.provider.chat(
-                messages=messages,
-                tools=self.tool_registry.get_definitions(),
-                model=self.model
-            )
+            # Stream the LLM response; tools start running as soon as their
+            # call is complete, overlapping with the rest of the generation
+            tool_tasks: List[asyncio.Task] = []
+            try:
+                response = await self._stream_response(messages, tool_tasks, on_delta)
+            except ProviderError as e:
+                # Retries are exhausted; end the turn with an error reply so the
+                # conversation (and any tool results so far) stays intact
+                error = str(e)
+                final_content = f"[ERROR] LLM request failed: {error}"
+                messages.append(Message(role="assistant", content=final_content))
+                break
 
             # Update usage
             if response.usage:
@@ -226,40 +373,19 @@ class PicoClawAgent:
                 break
 
             # Add assistant message with tool calls
-            tool_calls_data = [
-                {
-                    "id": tc.id,
-                    "name": tc.name,
-                    "arguments": tc.arguments
-                }
-                for tc in response.tool_calls
-            ]
             messages.append(Message(
                 role="assistant",
                 content=response.content or "",
-                tool_calls=tool_calls_data
+                tool_calls=response.tool_calls
             ))
 
-            # Execute tool calls
-            for tool_call in response.tool_calls:
-                tool_name = tool_call.name
-                tool_args = tool_call.arguments
-
-                # Execute tool
-                try:
-                    result = await self.tool_registry.execute(tool_name, **tool_args)
-                    tool_results_log.append({
-                        "tool": tool_name,
-                        "args": tool_args,
-                        "result": result
-                    })
-                except Exception as e:
-                    result = f"[ERROR] Tool execution failed: {str(e)}"
-                    tool_results_log.append({
-                        "tool": tool_name,
-                        "args": tool_args,
-                        "error": str(e)
-                    })
+            # Wait for the tool calls dispatched during streaming; results are
+            # appended in the original order so tool_call_ids line up with the
+            # assistant turn
+            results = await asyncio.gather(*tool_tasks)
+
+            for tool_call, result, log_entry in results:
+                tool_results_log.append(log_entry)
 
                 # Add tool result to messages
                 messages.append(Message(
@@ -268,25 +394,158 @@ class PicoClawAgent:
                     tool_call_id=tool_call.id
                 ))
 
-        return {
+        result = {
             "content": final_content,
             "usage": total_usage,
             "iterations": iterations,
             "tool_results": tool_results_log,
             "messages": messages  # Return full message history
         }
+        if error:
+            result["error"] = error
+        return result
+
+    async def chat_batch(
+        self,
+        user_messages: List[str],
+        max_concurrency: int = 8,
+        **options
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer independent user messages in one provider batch
+
+        Each message gets a single turn against the shared system prompt. Tools
+        are not offered, since batch results come back with no chance to run
+        them. Uses the provider's batch API when it has one (cheaper, but with
+        minutes-to-hours latency), otherwise concurrent chat calls.
+
+        Returns one dict per message, in order, shaped like chat()'s result.
+        """
+        system_messages = self.context_builder.build_system_prompt().to_messages()
+        conversations = [
+            [*system_messages, Message(role="user", content=user_message)]
+            for user_message in user_messages
+        ]
+
+        responses = await self.provider.chat_batch(
+            conversations,
+            model=self.model,
+            max_concurrency=max_concurrency,
+            **options
+        )
+
+        results = []
+        for messages, response in zip(conversations, responses):
+            if isinstance(response, ProviderError):
+                content = f"[ERROR] LLM request failed: {response}"
+                usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            else:
+                content = response.content or ""
+                usage = {
+                    "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+                    "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+                    "total_tokens": response.usage.total_tokens if response.usage else 0
+                }
+            messages.append(Message(role="assistant", content=content))
+
+            result = {
+                "content": content,
+                "usage": usage,
+                "iterations": 1,
+                "tool_results": [],
+                "messages": messages
+            }
+            if isinstance(response, ProviderError):
+                result["error"] = str(response)
+            results.append(result)
+
+        return results
+
+    async def _stream_response(
+        self,
+        messages: List[Message],
+        tool_tasks: List[asyncio.Task],
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> LLMResponse:
+        """
+        Consume a streamed LLM turn, dispatching each completed tool call as a
+        task appended to tool_tasks (and forwarding text to on_delta), and
+        return the assembled response
+        """
+        content_parts: List[str] = []
+        tool_calls: List[ToolCall] = []
+        usage: Optional[UsageInfo] = None
+        finish_reason = "stop"
+
+        try:
+            async for event in self.provider.chat_stream(
+                messages=messages,
+                tools=self.tool_registry.get_definitions_for(self.provider.tool_format),
+                model=self.model
+            ):
+                match event:
+                    case TextDelta(text=text):
+                        content_parts.append(text)
+                        if on_delta is not None:
+                            await on_delta(text)
+                    case ToolCallComplete(tool_call=tool_call):
+                        tool_calls.append(tool_call)
+                        tool_tasks.append(asyncio.create_task(self._exec_one(tool_call)))
+                    case UsageFinal(usage=final_usage, finish_reason=reason):
+                        usage = final_usage
+                        finish_reason = reason
+        except BaseException:
+            for task in tool_tasks:
+                task.cancel()
+            raise
+
+        return LLMResponse(
+            content="".join(content_parts),
+            tool_calls=tool_calls or None,
+            finish_reason=finish_reason,
+            usage=usage
+        )
+
+    async def _exec_one(self, tool_call: ToolCall) -> Tuple[ToolCall, str, Dict[str, Any]]:
+        """Execute a single tool call, capturing errors as a tool result"""
+        tool_name = tool_call.name
+        tool_args = tool_call.arguments
+
+        async with self._tool_semaphore:
+            try:
+                result, cached = await self.tool_registry.execute_cached(tool_name, **tool_args)
+                log_entry = {
+                    "tool": tool_name,
+                    "args": tool_args,
+                    "result": result,
+                    "cached": cached
+                }
+            except Exception as e:
+                result = f"[ERROR] Tool execution failed: {str(e)}"
+                log_entry = {
+                    "tool": tool_name,
+                    "args": tool_args,
+                    "error": str(e)
+                }
+
+        return tool_call, result, log_entry
 
     async def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a single tool directly"""
         return await self.tool_registry.execute(tool_name, **kwargs)
 
+    async def aclose(self):
+        """Release provider resources (HTTP connection pools)"""
+        await self.provider.aclose()
+
 
 def create_default_agent(
     api_key: str,
     provider_type: str = "anthropic",
     workspace: Optional[str] = None,
     brave_api_key: Optional[str] = None,
-    model: Optional[str] = None
+    model: Optional[str] = None,
+    http_client: Optional[httpx.AsyncClient] = None
 ) -> PicoClawAgent:
     """
     Create a PicoClaw agent with default configuration
@@ -297,6 +556,8 @@ def create_default_agent(
         workspace: Workspace directory path
         brave_api_key: Optional Brave Search API key
         model: Optional model override
+        http_client: Optional shared HTTP client for the provider; the caller
+            keeps ownership and closes it
 
     Returns:
         Configured PicoClawAgent instance
@@ -316,21 +577,21 @@ def create_default_agent(
 
     # Create provider
     if provider_type == "anthropic":
-        provider = AnthropicProvider(api_key)
+        provider = AnthropicProvider(api_key, client=http_client)
     elif provider_type == "openai":
-        provider = OpenAIProvider(api_key)
+        provider = OpenAIProvider(api_key, client=http_client)
     elif provider_type == "openrouter":
-        provider = OpenRouterProvider(api_key)
+        provider = OpenRouterProvider(api_key, client=http_client)
     elif provider_type == "kilocode":
-        provider = KiloCodeProvider(api_key)
+        provider = KiloCodeProvider(api_key, client=http_client)
     elif provider_type == "groq":
-        provider = GroqProvider(api_key)
+        provider = GroqProvider(api_key, client=http_client)
     elif provider_type == "together":
-        provider = TogetherProvider(api_key)
+        provider = TogetherProvider(api_key, client=http_client)
     elif provider_type == "cohere":
-        provider = CohereProvider(api_key)
+        provider = CohereProvider(api_key, client=http_client)
     elif provider_type == "google":
-        provider = GoogleProvider(api_key)
+        provider = GoogleProvider(api_key, client=http_client)
     else:
         raise ValueError(f"Unknown provider type: {provider_type}")
 
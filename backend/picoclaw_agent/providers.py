@@ -4,21 +4,53 @@ Supports: Anthropic Claude, OpenAI, OpenRouter, and more
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Union, AsyncIterator, Callable, Tuple
+import asyncio
+import hashlib
 import httpx
 import json
+import logging
+import random
+import time
 from dataclasses import dataclass
 
+try:
+    import orjson
 
-@dataclass
-class Message:
-    role: str
-    content: str
-    tool_calls: Optional[List[Dict[str, Any]]] = None
-    tool_call_id: Optional[str] = None
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    _json_loads = json.loads
+
+logger = logging.getLogger(__name__)
 
+# Transient failures worth retrying: rate limits, server errors and dropped connections
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# (any timeout, connect/read/write errors, and peers dropping the connection
+# mid-response); other transport errors fail immediately
+RETRY_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 30.0
 
-@dataclass
+# Batch jobs take minutes to hours; poll status with backoff up to this interval
+MAX_BATCH_POLL_INTERVAL = 60.0
+
+
+class ProviderError(Exception):
+    """A provider request that failed for good (after any retries)"""
+
+    def __init__(self, provider: str, status: Optional[int], body: str):
+        self.provider = provider
+        self.status = status
+        self.body = body
+        super().__init__(f"{provider} API error: {status} - {body}")
+
+
+@dataclass(slots=True)
 class ToolCall:
     id: str
     name: str
@@ -26,14 +58,24 @@ class ToolCall:
     type: str = "function"
 
 
-@dataclass
+@dataclass(slots=True)
+class Message:
+    role: str
+    content: Union[str, List[Dict[str, Any]]]
+    tool_calls: Optional[List[ToolCall]] = None
+    tool_call_id: Optional[str] = None
+    # Mark a (system) message as a prompt-caching breakpoint
+    cache: bool = False
+
+
+@dataclass(slots=True)
 class UsageInfo:
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
 
 
-@dataclass
+@dataclass(slots=True)
 class LLMResponse:
     content: str
     tool_calls: Optional[List[ToolCall]] = None
@@ -41,9 +83,235 @@ class LLMResponse:
     usage: Optional[UsageInfo] = None
 
 
+# Shared read-only defaults for response parsing
+_EMPTY_DICT: Dict[str, Any] = {}
+_EMPTY_LIST: List[Any] = []
+
+
+# Streaming events yielded by LLMProvider.chat_stream
+
+@dataclass(slots=True)
+class TextDelta:
+    text: str
+
+
+@dataclass(slots=True)
+class ToolCallStart:
+    index: int
+    id: str
+    name: str
+
+
+@dataclass(slots=True)
+class ToolCallDelta:
+    index: int
+    partial_json: str
+
+
+@dataclass(slots=True)
+class ToolCallComplete:
+    index: int
+    tool_call: ToolCall
+
+
+@dataclass(slots=True)
+class UsageFinal:
+    usage: Optional[UsageInfo]
+    finish_reason: str = "stop"
+
+
+StreamEvent = Union[TextDelta, ToolCallStart, ToolCallDelta, ToolCallComplete, UsageFinal]
+
+
+def _content_text(content: Union[str, List[Dict[str, Any]]]) -> str:
+    """Flatten block-structured content into a single string"""
+    if isinstance(content, str):
+        return content
+    return "\n".join(block["text"] for block in content)
+
+
+def _parse_arguments(raw: Union[str, Dict[str, Any], None]) -> Dict[str, Any]:
+    """
+    Decode tool-call arguments (empty means no arguments)
+
+    Some OpenAI-compatible servers return arguments already parsed; those are
+    passed through without a JSON round trip.
+    """
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        return raw
+    return _json_loads(raw)
+
+
+async def _iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """Yield the payload of each `data:` line of a server-sent event stream"""
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            yield line[5:].strip()
+
+
+def _anthropic_tool_result(msg: Message) -> Dict[str, Any]:
+    """Convert a tool result into an Anthropic user turn"""
+    return {
+        "role": "user",
+        "content": [
+            {
+                "type": "tool_result",
+                "tool_use_id": msg.tool_call_id,
+                "content": msg.content
+            }
+        ]
+    }
+
+
+def _anthropic_message(msg: Message) -> Dict[str, Any]:
+    """Convert a user/assistant message into Anthropic format"""
+    content = msg.content
+    if len(content) > 2000:
+        # pyre-ignore[6, 16]
+        content = "...\n" + content[-2000:]
+
+    tool_calls = msg.tool_calls
+    if tool_calls is None:
+        return {"role": msg.role, "content": content}
+
+    # Text block (if any) followed by one tool_use block per call
+    offset = 1 if content else 0
+    blocks: List[Any] = [None] * (offset + len(tool_calls))
+    if content:
+        blocks[0] = {"type": "text", "text": content}
+    for i, tc in enumerate(tool_calls, offset):
+        blocks[i] = {
+            "type": "tool_use",
+            "id": tc.id,
+            "name": tc.name,
+            "input": tc.arguments or _EMPTY_DICT
+        }
+    return {"role": msg.role, "content": blocks}
+
+
+_ANTHROPIC_ROLE_HANDLERS = {
+    "tool": _anthropic_tool_result,
+    "user": _anthropic_message,
+    "assistant": _anthropic_message,
+}
+
+
+def _openai_message(msg: Message) -> Dict[str, Any]:
+    """Convert a message into OpenAI format"""
+    message_data: Dict[str, Any] = {
+        "role": msg.role,
+        "content": _content_text(msg.content)
+    }
+
+    if msg.tool_calls is not None:
+        message_data["tool_calls"] = [
+            {
+                "id": tc.id,
+                "type": tc.type,
+                "function": {
+                    "name": tc.name,
+                    "arguments": _json_dumps(tc.arguments or _EMPTY_DICT).decode()
+                }
+            }
+            for tc in msg.tool_calls
+        ]
+
+    if msg.tool_call_id is not None:
+        message_data["tool_call_id"] = msg.tool_call_id
+
+    return message_data
+
+
+class _MessageEncoder:
+    """
+    Encodes wire-format messages to JSON once per Message object
+
+    The agent's history is append-only, so on each request only the newly
+    appended messages are encoded; earlier fragments are reused as-is, which
+    also keeps the serialized prefix byte-stable for server-side prompt caching.
+    """
+
+    def __init__(self, convert: Callable[[Message], Dict[str, Any]]):
+        self._convert = convert
+        # id(message) -> (message, fragment); holding the message keeps its id unique
+        self._fragments: Dict[int, Tuple[Message, bytes]] = {}
+        # (message count, digest) of the previous request
+        self._last_prefix: Tuple[int, bytes] = (0, b"")
+
+    def encode(self, messages: List[Message]) -> List[bytes]:
+        previous = self._fragments
+        current: Dict[int, Tuple[Message, bytes]] = {}
+        fragments: List[bytes] = []
+
+        for msg in messages:
+            entry = previous.get(id(msg))
+            if entry is None or entry[0] is not msg:
+                entry = (msg, _json_dumps(self._convert(msg)))
+            current[id(msg)] = entry
+            fragments.append(entry[1])
+
+        self._fragments = current
+        self._check_prefix(fragments)
+        return fragments
+
+    def _check_prefix(self, fragments: List[bytes]):
+        """Log whether this request extends the previous one byte-for-byte"""
+        count, digest = self._last_prefix
+        hasher = hashlib.blake2b(digest_size=16)
+        prefix_digest = None
+
+        for i, fragment in enumerate(fragments):
+            if i == count:
+                prefix_digest = hasher.digest()
+            hasher.update(fragment)
+            hasher.update(b",")
+        full_digest = hasher.digest()
+        if count == len(fragments):
+            prefix_digest = full_digest
+
+        if count:
+            logger.debug(
+                "Prompt prefix %s (previous request: %d messages, this request: %d)",
+                "hit" if prefix_digest == digest else "miss", count, len(fragments)
+            )
+        self._last_prefix = (len(fragments), full_digest)
+
+
+def _splice_messages(
+    params: Dict[str, Any],
+    fragments: List[bytes],
+    tools_json: Optional[bytes] = None
+) -> bytes:
+    """Build a JSON request body from params plus pre-encoded messages and tools"""
+    body = b'{"messages":[' + b",".join(fragments) + b"]"
+    if tools_json is not None:
+        body += b',"tools":' + tools_json
+    rest = _json_dumps(params)
+    if rest == b"{}":
+        return body + b"}"
+    return body + b"," + rest[1:]
+
+
+def _create_client() -> httpx.AsyncClient:
+    """Create a pooled HTTP client, reused across requests by a provider"""
+    return httpx.AsyncClient(
+        timeout=60.0,
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+
+
 class LLMProvider(ABC):
     """Base class for LLM providers"""
 
+    # Native tool definition format ("openai" or "anthropic")
+    tool_format = "openai"
+
+    # Whether chat_batch() uses a provider-side batch API
+    supports_batch = False
+
     @abstractmethod
     async def chat(
         self,
@@ -60,146 +328,642 @@ class LLMProvider(ABC):
         """Get the default model name"""
         raise NotImplementedError()
 
-
-class AnthropicProvider(LLMProvider):
+    async def chat_stream(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        model: Optional[str] = None,
+        **options
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        Stream a chat response as incremental events
+
+        Providers without native streaming fall back to a single chat() call.
+        """
+        response = await self.chat(messages, tools=tools, model=model, **options)
+        if response.content:
+            yield TextDelta(response.content)
+        for index, tool_call in enumerate(response.tool_calls or []):
+            yield ToolCallComplete(index, tool_call)
+        yield UsageFinal(response.usage, response.finish_reason)
+
+    async def chat_batch(
+        self,
+        conversations: List[List[Message]],
+        model: Optional[str] = None,
+        max_concurrency: int = 8,
+        **options
+    ) -> List[Union[LLMResponse, ProviderError]]:
+        """
+        Answer independent conversations, returning results in input order
+
+        Failed conversations yield their ProviderError instead of aborting the
+        batch. This fallback fans out chat() calls bounded by max_concurrency;
+        providers with a native batch API override it.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(messages: List[Message]) -> Union[LLMResponse, ProviderError]:
+            async with semaphore:
+                try:
+                    return await self.chat(messages, model=model, **options)
+                except ProviderError as e:
+                    return e
+
+        return list(await asyncio.gather(*(run_one(messages) for messages in conversations)))
+
+    async def aclose(self):
+        """Release any resources held by the provider"""
+        pass
+
+
+class AsyncTokenBucket:
+    """
+    Token-bucket limiter for outbound requests per minute and tokens per minute
+
+    Either limit may be None (unlimited). Waiters are served in arrival order.
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int = 0):
+        """Wait until one request and an estimated number of tokens are available"""
+        if self.tpm:
+            # A single oversized request must not wait forever
+            tokens = min(tokens, self.tpm)
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = self._blocked_until - now
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+
+                if wait <= 0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+                await asyncio.sleep(wait)
+
+    def penalize(self, delay: float):
+        """
+        Rebalance after a 429: the server's accounting says we have no headroom,
+        so drain both buckets and hold every caller for the advised delay
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self._requests = min(self._requests, 0.0)
+        self._tokens = min(self._tokens, 0.0)
+        self._blocked_until = max(self._blocked_until, now + delay)
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """Seconds to wait before retrying, honouring Retry-After when the server sends one"""
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_BACKOFF)
+            except ValueError:
+                pass  # HTTP-date form; fall back to exponential backoff
+    return min(2 ** attempt, MAX_BACKOFF) + random.random() * 0.5
+
+
+def _estimate_tokens(body: bytes) -> int:
+    """Crude prompt size estimate for rate limiting (~4 bytes per token)"""
+    return len(body) // 4
+
+
+class HTTPProvider(LLMProvider):
+    """Base class for providers talking JSON over a pooled HTTP client"""
+
+    # Used in error messages
+    provider_name = "LLM"
+
+    _client: httpx.AsyncClient
+    # False when the client was passed in and is closed by its owner
+    _owns_client: bool = True
+    _headers: Dict[str, str]
+    _rate_limiter: Optional[AsyncTokenBucket] = None
+    # (tools list, encoded wire form) of the last tools seen
+    _tools_json_cache: Optional[Tuple[List[Dict[str, Any]], bytes]] = None
+
+    def _wire_tools(self, tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Tool definitions as sent on the wire"""
+        return tools
+
+    def _encode_tools(self, tools: List[Dict[str, Any]]) -> bytes:
+        """
+        Encode tool definitions, memoized on the list's identity
+
+        ToolRegistry hands out the same list until a tool is registered, so
+        the schema is encoded once rather than on every request. The cache
+        holds a reference to the list, so its id can't be reused.
+        """
+        cache = self._tools_json_cache
+        if cache is not None and cache[0] is tools:
+            return cache[1]
+        encoded = _json_dumps(self._wire_tools(tools))
+        self._tools_json_cache = (tools, encoded)
+        return encoded
+
+    def _init_rate_limiter(self, rpm: Optional[int], tpm: Optional[int]):
+        """Shape outbound traffic to the account's published limits, if given"""
+        self._rate_limiter = AsyncTokenBucket(rpm, tpm) if rpm or tpm else None
+
+    def _init_client(self, client: Optional[httpx.AsyncClient]):
+        """Use a shared client if given (not closed by aclose), else a private pool"""
+        self._client = client or _create_client()
+        self._owns_client = client is None
+
+    async def aclose(self):
+        """Close the underlying HTTP client, unless it is shared"""
+        if self._owns_client:
+            await self._client.aclose()
+
+    async def _send_with_retry(
+        self,
+        method: str,
+        url: str,
+        stream: bool = False,
+        tokens: int = 0,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Send a request, retrying transient failures with jittered backoff
+
+        tokens is the estimated token cost charged to the rate limiter.
+        Returns a 200 response (still open when stream=True) or raises ProviderError.
+        """
+        kwargs.setdefault("headers", self._headers)
+        rate_limiter = self._rate_limiter
+        for attempt in range(MAX_ATTEMPTS):
+            last_attempt = attempt == MAX_ATTEMPTS - 1
+            if rate_limiter is not None:
+                await rate_limiter.acquire(tokens)
+            request = self._client.build_request(method, url, **kwargs)
+            try:
+                response = await self._client.send(request, stream=stream)
+            except RETRY_EXCEPTIONS as e:
+                if last_attempt:
+                    raise ProviderError(self.provider_name, None, str(e)) from e
+                delay = _retry_delay(attempt)
+                logger.warning("%s request failed (%s), retrying in %.1fs", self.provider_name, e, delay)
+            except httpx.HTTPError as e:
+                raise ProviderError(self.provider_name, None, str(e)) from e
+            else:
+                if response.status_code == 200:
+                    return response
+                if stream:
+                    try:
+                        await response.aread()
+                    finally:
+                        await response.aclose()
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    raise ProviderError(self.provider_name, response.status_code, response.text)
+                delay = _retry_delay(attempt, response)
+                if response.status_code == 429 and rate_limiter is not None:
+                    rate_limiter.penalize(delay)
+                logger.warning(
+                    "%s returned %d, retrying in %.1fs", self.provider_name, response.status_code, delay
+                )
+            await asyncio.sleep(delay)
+
+    async def _post_with_retry(
+        self,
+        url: str,
+        body: bytes,
+        tokens: Optional[int] = None
+    ) -> httpx.Response:
+        """POST a JSON request body, retrying transient failures"""
+        if tokens is None:
+            tokens = _estimate_tokens(body)
+        return await self._send_with_retry("POST", url, tokens=tokens, content=body)
+
+    @asynccontextmanager
+    async def _stream_with_retry(
+        self,
+        url: str,
+        body: Optional[bytes] = None,
+        method: str = "POST"
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        Open a streaming request, retrying transient failures until the response starts
+
+        Once events have been yielded the request is not replayed; transport errors
+        mid-stream surface as ProviderError.
+        """
+        response = await self._send_with_retry(
+            method, url, stream=True, tokens=_estimate_tokens(body) if body else 0, content=body
+        )
+        try:
+            yield response
+        except httpx.HTTPError as e:
+            raise ProviderError(self.provider_name, None, str(e)) from e
+        finally:
+            await response.aclose()
+
+    async def _poll_batch(
+        self,
+        url: str,
+        is_done: Callable[[Dict[str, Any]], bool],
+        poll_interval: float
+    ) -> Dict[str, Any]:
+        """Poll a batch status URL, backing off up to MAX_BATCH_POLL_INTERVAL, until is_done"""
+        while True:
+            response = await self._send_with_retry("GET", url)
+            status = _json_loads(response.content)
+            if is_done(status):
+                return status
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, MAX_BATCH_POLL_INTERVAL)
+
+    async def _iter_jsonl(self, url: str) -> AsyncIterator[Dict[str, Any]]:
+        """Stream-download a JSONL results file, one decoded record at a time"""
+        async with self._stream_with_retry(url, method="GET") as response:
+            async for line in response.aiter_lines():
+                if line:
+                    yield _json_loads(line)
+
+
+class AnthropicProvider(HTTPProvider):
     """Anthropic Claude API Provider"""
 
-    def __init__(self, api_key: str):
+    tool_format = "anthropic"
+    provider_name = "Anthropic"
+    supports_batch = True
+
+    def __init__(
+        self,
+        api_key: str,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ):
         self.api_key = api_key
         self.base_url = "https://api.anthropic.com/v1"
         self.default_model = "claude-3-5-sonnet-20241022"
+        self._headers = {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+        self._init_client(client)
+        self._encoder = _MessageEncoder(self._convert_message)
+        self._init_rate_limiter(rpm, tpm)
 
     def get_default_model(self) -> str:
         return self.default_model
 
-    async def chat(
+    def _build_params(
         self,
         messages: List[Message],
-        tools: Optional[List[Dict[str, Any]]] = None,
-        model: Optional[str] = None,
-        **options
-    ) -> LLMResponse:
-        """Chat with Claude API"""
-
-        # Extract system message
-        system_content = ""
-        chat_messages = []
-
-        for msg in messages:
-            if msg.role == "system":
-                system_content = msg.content
-            elif msg.role == "tool":
-                chat_messages.append({
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": msg.tool_call_id,
-                            "content": msg.content
-                        }
-                    ]
-                })
-            else:
-                content = msg.content
-                if len(content) > 2000:
-                    # pyre-ignore[6, 16]
-                    content = "...\n" + content[-2000:]
-                message_data: Dict[str, Any] = {"role": msg.role, "content": content}
-
-                # Add tool calls if present
-                if msg.tool_calls is not None:
-                    tool_uses: List[Dict[str, Any]] = []
-                    for tc in (msg.tool_calls or []):
-                        tool_uses.append({
-                            "type": "tool_use",
-                            "id": tc.get("id"),
-                            "name": tc.get("name"),
-                            "input": tc.get("arguments", {})
-                        })
-                    message_data["content"] = [{"type": "text", "text": content}] + tool_uses if content else tool_uses
-
-                chat_messages.append(message_data)
+        tools: Optional[List[Dict[str, Any]]],
+        model: Optional[str],
+        options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Build the Messages API request body, except for the messages list"""
 
         # Build request
         payload: Dict[str, Any] = {
             "model": model or self.default_model,
             "max_tokens": options.get("max_tokens", 4096),
-            "messages": chat_messages,
         }
 
-        if system_content:
-            payload["system"] = system_content
+        # System messages travel in the top-level "system" field as blocks;
+        # cacheable ones get a prompt-caching breakpoint
+        system_blocks = [
+            {"type": "text", "text": _content_text(m.content), "cache_control": {"type": "ephemeral"}}
+            if m.cache else {"type": "text", "text": _content_text(m.content)}
+            for m in messages
+            if m.role == "system" and m.content
+        ]
+        if len(system_blocks) == 1 and "cache_control" not in system_blocks[0]:
+            payload["system"] = system_blocks[0]["text"]
+        elif system_blocks:
+            payload["system"] = system_blocks
 
         if tools is not None:
-            # Convert to Anthropic tool format
-            anthropic_tools: List[Dict[str, Any]] = []
-            for tool in (tools or []):
-                anthropic_tools.append({
+            payload["tools"] = self._wire_tools(tools)
+
+        return payload
+
+    def _wire_tools(self, tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Tool definitions in Anthropic format, with a prompt-caching breakpoint"""
+        # Convert to Anthropic tool format unless already converted
+        # (e.g. ToolRegistry.get_anthropic_definitions())
+        if tools and "function" in tools[0]:
+            tools = [
+                {
                     "name": tool["function"]["name"],
                     "description": tool["function"]["description"],
                     "input_schema": tool["function"]["parameters"]
-                })
-            payload["tools"] = anthropic_tools
-
-        # Make request
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/messages",
-                headers={
-                    "x-api-key": self.api_key,
-                    "anthropic-version": "2023-06-01",
-                    "content-type": "application/json"
-                },
-                json=payload,
-                timeout=60.0
-            )
-
-            if response.status_code != 200:
-                raise Exception(f"Anthropic API error: {response.status_code} - {response.text}")
-
-            data = response.json()
+                }
+                for tool in tools
+            ]
+        if tools:
+            # Tool definitions precede the system prompt in the cached
+            # prefix; copy the last one rather than mutating a shared list
+            tools = tools[:-1] + [{**tools[-1], "cache_control": {"type": "ephemeral"}}]
+        return tools
+
+    @staticmethod
+    def _convert_message(msg: Message) -> Dict[str, Any]:
+        return _ANTHROPIC_ROLE_HANDLERS.get(msg.role, _anthropic_message)(msg)
+
+    @staticmethod
+    def _chat_messages(messages: List[Message]) -> List[Message]:
+        # The system prompt travels in the top-level "system" field
+        return [m for m in messages if m.role != "system"]
+
+    def _build_payload(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]],
+        model: Optional[str],
+        options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Convert messages and tools into a Messages API request body"""
+        payload = self._build_params(messages, tools, model, options)
+        payload["messages"] = [self._convert_message(m) for m in self._chat_messages(messages)]
+        return payload
+
+    def _build_body(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]],
+        model: Optional[str],
+        options: Dict[str, Any],
+        **extra
+    ) -> bytes:
+        """Encode a request body, reusing already-encoded history messages"""
+        params = self._build_params(messages, None, model, options)
+        params.update(extra)
+        return _splice_messages(
+            params,
+            self._encoder.encode(self._chat_messages(messages)),
+            self._encode_tools(tools) if tools is not None else None
+        )
 
-            # Parse response
-            content_text = ""
-            tool_calls = []
+    async def chat(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        model: Optional[str] = None,
+        **options
+    ) -> LLMResponse:
+        """Chat with Claude API"""
+        body = self._build_body(messages, tools, model, options)
 
-            for block in data.get("content", []):
-                if block["type"] == "text":
-                    content_text = block["text"]
-                elif block["type"] == "tool_use":
-                    tool_calls.append(ToolCall(
-                        id=block["id"],
-                        name=block["name"],
-                        arguments=block["input"]
-                    ))
-
-            usage = UsageInfo(
-                prompt_tokens=data.get("usage", {}).get("input_tokens", 0),
-                completion_tokens=data.get("usage", {}).get("output_tokens", 0),
-                total_tokens=data.get("usage", {}).get("input_tokens", 0) + data.get("usage", {}).get("output_tokens", 0)
-            )
+        # Make request
+        response = await self._post_with_retry(f"{self.base_url}/messages", body)
+
+        return self._parse_response(_json_loads(response.content))
+
+    @staticmethod
+    def _parse_response(data: Dict[str, Any]) -> LLMResponse:
+        """Convert a Messages API response body into an LLMResponse"""
+        content_text = ""
+        tool_calls: List[ToolCall] = []
+        tool_calls_append = tool_calls.append
+
+        for block in data.get("content") or _EMPTY_LIST:
+            block_type = block["type"]
+            if block_type == "text":
+                content_text = block["text"]
+            elif block_type == "tool_use":
+                tool_calls_append(ToolCall(block["id"], block["name"], block["input"]))
+
+        usage_data = data.get("usage") or _EMPTY_DICT
+        input_tokens = usage_data.get("input_tokens", 0)
+        output_tokens = usage_data.get("output_tokens", 0)
+        usage = UsageInfo(
+            prompt_tokens=input_tokens,
+            completion_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens
+        )
+
+        return LLMResponse(
+            content=content_text,
+            tool_calls=tool_calls if tool_calls else None,
+            finish_reason=data.get("choices", [{}])[0].get("finish_reason", "stop"),
+            usage=usage
+        )
+
+
+    async def chat_batch(
+        self,
+        conversations: List[List[Message]],
+        model: Optional[str] = None,
+        max_concurrency: int = 8,
+        poll_interval: float = 5.0,
+        **options
+    ) -> List[Union[LLMResponse, ProviderError]]:
+        """Answer conversations through the Message Batches API"""
+        if not conversations:
+            return []
+
+        requests = [
+            {"custom_id": str(i), "params": self._build_payload(messages, None, model, options)}
+            for i, messages in enumerate(conversations)
+        ]
+        response = await self._post_with_retry(
+            f"{self.base_url}/messages/batches",
+            _json_dumps({"requests": requests}),
+            tokens=0
+        )
+        batch = _json_loads(response.content)
+        logger.info("Submitted Anthropic batch %s with %d requests", batch["id"], len(requests))
+
+        batch = await self._poll_batch(
+            f"{self.base_url}/messages/batches/{batch['id']}",
+            lambda status: status.get("processing_status") == "ended",
+            poll_interval
+        )
+
+        results: List[Union[LLMResponse, ProviderError, None]] = [None] * len(conversations)
+        async for record in self._iter_jsonl(batch["results_url"]):
+            result = record["result"]
+            if result["type"] == "succeeded":
+                outcome = self._parse_response(result["message"])
+            else:
+                # errored, canceled or expired; errored results wrap the API error object
+                error = result.get("error") or _EMPTY_DICT
+                error = error.get("error", error)
+                outcome = ProviderError(self.provider_name, None, error.get("message") or result["type"])
+            results[int(record["custom_id"])] = outcome
+
+        return [
+            result if result is not None else ProviderError(self.provider_name, None, "missing from batch results")
+            for result in results
+        ]
+
+    async def chat_stream(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        model: Optional[str] = None,
+        **options
+    ) -> AsyncIterator[StreamEvent]:
+        """Stream a chat response from Claude API"""
+        body = self._build_body(messages, tools, model, options, stream=True)
+
+        async with self._stream_with_retry(f"{self.base_url}/messages", body) as response:
+            input_tokens = 0
+            output_tokens = 0
+            stop_reason = "stop"
+            # content block index -> [id, name, argument fragments]
+            tool_blocks: Dict[int, List[Any]] = {}
+
+            async for data in _iter_sse_data(response):
+                event = _json_loads(data)
+                event_type = event.get("type")
+
+                if event_type == "content_block_delta":
+                    delta = event["delta"]
+                    if delta["type"] == "text_delta":
+                        yield TextDelta(delta["text"])
+                    elif delta["type"] == "input_json_delta":
+                        tool_blocks[event["index"]][2].append(delta["partial_json"])
+                        yield ToolCallDelta(event["index"], delta["partial_json"])
+
+                elif event_type == "content_block_start":
+                    block = event["content_block"]
+                    if block["type"] == "tool_use":
+                        tool_blocks[event["index"]] = [block["id"], block["name"], []]
+                        yield ToolCallStart(event["index"], block["id"], block["name"])
+
+                elif event_type == "content_block_stop":
+                    block_info = tool_blocks.pop(event["index"], None)
+                    if block_info is not None:
+                        tool_id, tool_name, fragments = block_info
+                        yield ToolCallComplete(event["index"], ToolCall(
+                            id=tool_id,
+                            name=tool_name,
+                            arguments=_parse_arguments("".join(fragments))
+                        ))
+
+                elif event_type == "message_start":
+                    input_tokens = event["message"].get("usage", {}).get("input_tokens", 0)
+
+                elif event_type == "message_delta":
+                    stop_reason = event.get("delta", {}).get("stop_reason") or stop_reason
+                    output_tokens = event.get("usage", {}).get("output_tokens", output_tokens)
+
+                elif event_type == "message_stop":
+                    break
+
+                elif event_type == "error":
+                    error = event.get("error") or _EMPTY_DICT
+                    raise ProviderError(
+                        self.provider_name, None, f"{error.get('type')}: {error.get('message', '')}"
+                    )
 
-            return LLMResponse(
-                content=content_text,
-                tool_calls=tool_calls if tool_calls else None,
-                finish_reason=data.get("choices", [{}])[0].get("finish_reason", "stop"),
-                usage=usage
+            yield UsageFinal(
+                UsageInfo(
+                    prompt_tokens=input_tokens,
+                    completion_tokens=output_tokens,
+                    total_tokens=input_tokens + output_tokens
+                ),
+                finish_reason=stop_reason
             )
 
-        raise RuntimeError("Unreachable")
-
 
-class OpenAIProvider(LLMProvider):
+class OpenAIProvider(HTTPProvider):
     """OpenAI API Provider"""
 
-    def __init__(self, api_key: str, base_url: Optional[str] = None):
+    provider_name = "OpenAI"
+    supports_batch = True
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ):
         self.api_key = api_key
         self.base_url = base_url or "https://api.openai.com/v1"
         self.default_model = "gpt-4o"
+        self._headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        self._init_client(client)
+        self._encoder = _MessageEncoder(_openai_message)
+        self._init_rate_limiter(rpm, tpm)
 
     def get_default_model(self) -> str:
         return self.default_model
 
+    def _build_params(
+        self,
+        tools: Optional[List[Dict[str, Any]]],
+        model: Optional[str],
+        options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Build the Chat Completions request body, except for the messages list"""
+        payload: Dict[str, Any] = {
+            "model": model or self.default_model,
+            "max_tokens": options.get("max_tokens", 4096),
+        }
+
+        if tools is not None:
+            payload["tools"] = self._wire_tools(tools)
+
+        return payload
+
+    def _build_payload(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]],
+        model: Optional[str],
+        options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Convert messages and tools into a Chat Completions request body"""
+        payload = self._build_params(tools, model, options)
+        payload["messages"] = [_openai_message(m) for m in messages]
+        return payload
+
+    def _build_body(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]],
+        model: Optional[str],
+        options: Dict[str, Any],
+        **extra
+    ) -> bytes:
+        """Encode a request body, reusing already-encoded history messages"""
+        params = self._build_params(None, model, options)
+        params.update(extra)
+        return _splice_messages(
+            params,
+            self._encoder.encode(messages),
+            self._encode_tools(tools) if tools is not None else None
+        )
+
     async def chat(
         self,
         messages: List[Message],
@@ -208,140 +972,263 @@ class OpenAIProvider(LLMProvider):
         **options
     ) -> LLMResponse:
         """Chat with OpenAI API"""
+        body = self._build_body(messages, tools, model, options)
 
-        # Convert messages to OpenAI format
-        openai_messages: List[Dict[str, Any]] = []
-        for msg in messages:
-            message_data: Dict[str, Any] = {
-                "role": msg.role,
-                "content": msg.content
-            }
+        # Make request
+        response = await self._post_with_retry(f"{self.base_url}/chat/completions", body)
 
-            if msg.tool_calls is not None:
-                message_data["tool_calls"] = [
-                    {
-                        "id": tc.get("id"),
-                        "type": "function",
-                        "function": {
-                            "name": tc.get("name"),
-                            "arguments": json.dumps(tc.get("arguments", {}))
-                        }
-                    }
-                    for tc in (msg.tool_calls or [])
-                ]
+        return self._parse_response(_json_loads(response.content))
 
-            if msg.tool_call_id is not None:
-                message_data["tool_call_id"] = msg.tool_call_id
+    @staticmethod
+    def _parse_response(data: Dict[str, Any]) -> LLMResponse:
+        """Convert a Chat Completions response body into an LLMResponse"""
+        choice = data["choices"][0]
+        message = choice["message"]
 
-            openai_messages.append(message_data)
+        # Parse tool calls
+        tool_calls = None
+        raw_tool_calls = message.get("tool_calls")
+        if raw_tool_calls:
+            parse_arguments = _parse_arguments
+            tool_calls = []
+            tool_calls_append = tool_calls.append
+            for tc in raw_tool_calls:
+                function = tc["function"]
+                tool_calls_append(ToolCall(tc["id"], function["name"], parse_arguments(function.get("arguments"))))
+
+        usage_data = data.get("usage") or _EMPTY_DICT
+        usage = UsageInfo(
+            prompt_tokens=usage_data.get("prompt_tokens", 0),
+            completion_tokens=usage_data.get("completion_tokens", 0),
+            total_tokens=usage_data.get("total_tokens", 0)
+        )
+
+        return LLMResponse(
+            content=message.get("content", ""),
+            tool_calls=tool_calls,
+            finish_reason=choice.get("finish_reason", "stop"),
+            usage=usage
+        )
+
+
+    async def chat_batch(
+        self,
+        conversations: List[List[Message]],
+        model: Optional[str] = None,
+        max_concurrency: int = 8,
+        poll_interval: float = 5.0,
+        **options
+    ) -> List[Union[LLMResponse, ProviderError]]:
+        """Answer conversations through the Batch API"""
+        if not self.supports_batch:
+            return await super().chat_batch(conversations, model, max_concurrency, **options)
+        if not conversations:
+            return []
+
+        endpoint = "/v1/chat/completions"
+        jsonl = b"\n".join(
+            _json_dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": endpoint,
+                "body": self._build_payload(messages, None, model, options)
+            })
+            for i, messages in enumerate(conversations)
+        )
+
+        # The upload is multipart, so it goes without the JSON content type
+        response = await self._send_with_retry(
+            "POST",
+            f"{self.base_url}/files",
+            headers={"Authorization": self._headers["Authorization"]},
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", jsonl, "application/jsonl")}
+        )
+        input_file_id = _json_loads(response.content)["id"]
+
+        response = await self._post_with_retry(
+            f"{self.base_url}/batches",
+            _json_dumps({
+                "input_file_id": input_file_id,
+                "endpoint": endpoint,
+                "completion_window": "24h"
+            }),
+            tokens=0
+        )
+        batch = _json_loads(response.content)
+        logger.info("Submitted %s batch %s with %d requests", self.provider_name, batch["id"], len(conversations))
+
+        batch = await self._poll_batch(
+            f"{self.base_url}/batches/{batch['id']}",
+            lambda status: status.get("status") in ("completed", "failed", "expired", "cancelled"),
+            poll_interval
+        )
+
+        results: List[Union[LLMResponse, ProviderError, None]] = [None] * len(conversations)
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            async for record in self._iter_jsonl(f"{self.base_url}/files/{file_id}/content"):
+                response_data = record.get("response") or _EMPTY_DICT
+                if response_data.get("status_code") == 200:
+                    outcome = self._parse_response(response_data["body"])
+                else:
+                    error = record.get("error") or (response_data.get("body") or _EMPTY_DICT).get("error") or _EMPTY_DICT
+                    outcome = ProviderError(
+                        self.provider_name, response_data.get("status_code"), error.get("message", "")
+                    )
+                results[int(record["custom_id"])] = outcome
 
-        # Build request
-        payload = {
-            "model": model or self.default_model,
-            "messages": openai_messages,
-            "max_tokens": options.get("max_tokens", 4096),
-        }
+        missing = f"missing from batch results (batch {batch.get('status')})"
+        return [
+            result if result is not None else ProviderError(self.provider_name, None, missing)
+            for result in results
+        ]
 
-        if tools is not None:
-            payload["tools"] = tools
+    async def chat_stream(
+        self,
+        messages: List[Message],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        model: Optional[str] = None,
+        **options
+    ) -> AsyncIterator[StreamEvent]:
+        """Stream a chat response from OpenAI API"""
+        body = self._build_body(
+            messages, tools, model, options,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+        async with self._stream_with_retry(f"{self.base_url}/chat/completions", body) as response:
+            usage = None
+            finish_reason = "stop"
+            # tool call index -> [id, name, argument fragments]
+            tool_calls: Dict[int, List[Any]] = {}
+            current_index: Optional[int] = None
+
+            def complete(index: int) -> ToolCallComplete:
+                tool_id, tool_name, fragments = tool_calls[index]
+                return ToolCallComplete(index, ToolCall(
+                    id=tool_id,
+                    name=tool_name,
+                    arguments=_parse_arguments("".join(fragments))
+                ))
+
+            async for data in _iter_sse_data(response):
+                if data == "[DONE]":
+                    break
+
+                chunk = _json_loads(data)
+
+                if chunk.get("usage"):
+                    usage_data = chunk["usage"]
+                    usage = UsageInfo(
+                        prompt_tokens=usage_data.get("prompt_tokens", 0),
+                        completion_tokens=usage_data.get("completion_tokens", 0),
+                        total_tokens=usage_data.get("total_tokens", 0)
+                    )
 
-        # Make request
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json=payload,
-                timeout=60.0
-            )
+                if not chunk.get("choices"):
+                    continue
 
-            if response.status_code != 200:
-                raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
-
-            data = response.json()
-            choice = data["choices"][0]
-            message = choice["message"]
-
-            # Parse tool calls
-            tool_calls = None
-            if "tool_calls" in message:
-                tool_calls = [
-                    ToolCall(
-                        id=tc["id"],
-                        name=tc["function"]["name"],
-                        arguments=json.loads(tc["function"]["arguments"])
-                    )
-                    for tc in message["tool_calls"]
-                ]
-
-            usage_data = data.get("usage", {})
-            usage = UsageInfo(
-                prompt_tokens=usage_data.get("prompt_tokens", 0),
-                completion_tokens=usage_data.get("completion_tokens", 0),
-                total_tokens=usage_data.get("total_tokens", 0)
-            )
+                choice = chunk["choices"][0]
+                delta = choice.get("delta") or {}
 
-            return LLMResponse(
-                content=message.get("content", ""),
-                tool_calls=tool_calls,
-                finish_reason=choice.get("finish_reason", "stop"),
-                usage=usage
-            )
+                if delta.get("content"):
+                    yield TextDelta(delta["content"])
+
+                for tc in delta.get("tool_calls") or []:
+                    index = tc.get("index", 0)
+                    function = tc.get("function") or {}
+
+                    if index not in tool_calls:
+                        # Arguments stream in order, so a new index means the
+                        # previous call is complete and can be dispatched
+                        if current_index is not None:
+                            yield complete(current_index)
+                        current_index = index
+                        tool_calls[index] = [tc.get("id"), function.get("name"), []]
+                        yield ToolCallStart(index, tc.get("id"), function.get("name"))
+
+                    if function.get("arguments"):
+                        tool_calls[index][2].append(function["arguments"])
+                        yield ToolCallDelta(index, function["arguments"])
+
+                if choice.get("finish_reason"):
+                    finish_reason = choice["finish_reason"]
+                    if current_index is not None:
+                        yield complete(current_index)
+                        current_index = None
+
+            if current_index is not None:
+                yield complete(current_index)
+
+            yield UsageFinal(usage, finish_reason=finish_reason)
 
 
 class OpenRouterProvider(OpenAIProvider):
     """OpenRouter API Provider (OpenAI-compatible)"""
 
-    def __init__(self, api_key: str):
-        super().__init__(api_key, base_url="https://openrouter.ai/api/v1")
+    supports_batch = False
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(api_key, base_url="https://openrouter.ai/api/v1", **kwargs)
         self.default_model = "anthropic/claude-3.5-sonnet"
 
 
 class KiloCodeProvider(OpenAIProvider):
     """KiloCode API Provider (OpenAI-compatible)"""
 
-    def __init__(self, api_key: str):
-        super().__init__(api_key, base_url="https://api.kilocode.com/v1")
+    supports_batch = False
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(api_key, base_url="https://api.kilocode.com/v1", **kwargs)
         self.default_model = "kilocode-pro"
 
 
 class GroqProvider(OpenAIProvider):
     """Groq API Provider (OpenAI-compatible)"""
 
-    def __init__(self, api_key: str):
-        super().__init__(api_key, base_url="https://api.groq.com/openai/v1")
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(api_key, base_url="https://api.groq.com/openai/v1", **kwargs)
         self.default_model = "llama3-70b-8192"
 
 
 class TogetherProvider(OpenAIProvider):
     """Together AI API Provider (OpenAI-compatible)"""
 
-    def __init__(self, api_key: str):
-        super().__init__(api_key, base_url="https://api.together.xyz/v1")
+    supports_batch = False
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(api_key, base_url="https://api.together.xyz/v1", **kwargs)
         self.default_model = "meta-llama/Llama-3-70b-chat-hf"
 
 
 class CohereProvider(OpenAIProvider):
     """Cohere API Provider (OpenAI-compatible)"""
 
-    def __init__(self, api_key: str):
-        super().__init__(api_key, base_url="https://api.cohere.com/v1") # Or compat
+    supports_batch = False
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(api_key, base_url="https://api.cohere.com/v1", **kwargs) # Or compat
         self.default_model = "command-r-plus"
 
 
 class GoogleProvider(OpenAIProvider):
     """Google Gemini Provider (OpenAI-compatible endpoint if applicable, or generic fallback)"""
+
+    supports_batch = False
     
-    def __init__(self, api_key: str):
-        super().__init__(api_key, base_url="https://generativelanguage.googleapis.com/v1beta/openai")
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(api_key, base_url="https://generativelanguage.googleapis.com/v1beta/openai", **kwargs)
         self.default_model = "gemini-1.5-pro"
 
 
 class LLMProviderRegistry:
     """Registry to manage multiple LLM providers"""
 
+    __slots__ = ("providers", "default_provider")
+
     def __init__(self):
         self.providers: Dict[str, LLMProvider] = {}
         self.default_provider: Optional[str] = None
@@ -358,10 +1245,10 @@ class LLMProviderRegistry:
         if not provider_name:
             raise ValueError("No provider specified and no default provider set")
 
-        if provider_name not in self.providers:
-            raise ValueError(f"Provider '{provider_name}' not found")
-
-        return self.providers[provider_name]
+        try:
+            return self.providers[provider_name]
+        except KeyError:
+            raise ValueError(f"Provider '{provider_name}' not found") from None
 
     def list_providers(self) -> List[str]:
         """List all registered provider names"""
@@ -4,17 +4,54 @@ Includes: Filesystem, Shell, Web Search, and more
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
 import os
-import subprocess
+import re
+import signal
+import stat
 import json
+import hashlib
+import heapq
 import httpx
 from pathlib import Path
+from datetime import datetime
+from operator import attrgetter
+from cachetools import TTLCache
+
+# Buffer size for file writes; large outputs go out in few syscalls
+WRITE_BUFFER_SIZE = 1 << 20
+
+# read_file refuses files larger than this rather than loading them whole
+MAX_READ_BYTES = 10 << 20
+
+
+# Shared client for tool HTTP calls: keep-alive connections spare each call
+# a fresh TCP+TLS handshake. Close with aclose_http_client() on shutdown.
+_HTTP_CLIENT = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=30),
+    http2=True,
+    timeout=10.0
+)
+
+
+async def aclose_http_client():
+    """Close the shared tool HTTP client"""
+    await _HTTP_CLIENT.aclose()
 
 
 class Tool(ABC):
     """Base class for all tools"""
 
+    # Deterministic tools opt in to result memoization in ToolRegistry.
+    # Results are keyed on the arguments named in cache_key_fields (all
+    # arguments when empty) plus cache_version().
+    cacheable: bool = False
+    cache_key_fields: Tuple[str, ...] = ()
+    # Uncached tools that change nothing, so running them leaves the
+    # memoized results of other tools in place
+    read_only: bool = False
+
     @abstractmethod
     def get_name(self) -> str:
         """Get tool name"""
@@ -46,10 +83,64 @@ class Tool(ABC):
             }
         }
 
+    def get_anthropic_definition(self) -> Dict[str, Any]:
+        """Get tool definition in Anthropic Messages API format"""
+        return {
+            "name": self.get_name(),
+            "description": self.get_description(),
+            "input_schema": self.get_parameters()
+        }
+
     def get_summary(self) -> str:
         """Get a summary description for context"""
         return f"### {self.get_name()}\n{self.get_description()}\n"
 
+    def cache_version(self, **kwargs) -> Any:
+        """
+        Extra cache key component that changes when the underlying data does
+
+        Overrides may block on I/O; ToolRegistry runs them in a worker thread.
+        """
+        return None
+
+
+def _mtime_ns(workspace: str, path: str) -> Optional[int]:
+    """Modification time of a workspace path, or None if it can't be stat'ed"""
+    try:
+        return os.stat(os.path.join(workspace, path)).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def _within_workspace(root: Path, root_prefix: str, path: str) -> Optional[Path]:
+    """Resolve a relative path under the workspace root, or None if it escapes it"""
+    resolved = (root / path).resolve()
+    if resolved != root and not str(resolved).startswith(root_prefix):
+        return None
+    return resolved
+
+
+def _kill_process_group(proc: asyncio.subprocess.Process) -> None:
+    """Kill a shell started in its own session along with everything it spawned"""
+    # Killing only the shell would leave its children holding the output
+    # pipes, and wait() doesn't return until those close
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+
+
+DANGEROUS_COMMANDS = (
+    "rm -rf", "format", "shutdown", "reboot", "dd if=", "mkfs",
+    ":(){ :|:& };:", "fork()", "> /dev/sda"
+)
+# All patterns in one case-insensitive regex, compiled once at import: a
+# single scan per command with no lowercased copy of it
+_DANGER_RE = re.compile("|".join(map(re.escape, DANGEROUS_COMMANDS)), re.IGNORECASE)
+
 
 class ShellTool(Tool):
     """Execute shell commands in a sandboxed environment"""
@@ -57,10 +148,8 @@ class ShellTool(Tool):
     def __init__(self, workspace: str, sandbox: bool = True):
         self.workspace = workspace
         self.sandbox = sandbox
-        self.dangerous_commands = [
-            "rm -rf", "format", "shutdown", "reboot", "dd if=", "mkfs",
-            ":(){ :|:& };:", "fork()", "> /dev/sda"
-        ]
+        self.dangerous_commands = list(DANGEROUS_COMMANDS)
+        self._danger_re = _DANGER_RE
 
     def get_name(self) -> str:
         return "shell"
@@ -85,32 +174,41 @@ class ShellTool(Tool):
 
         # Security check
         if self.sandbox:
-            for dangerous in self.dangerous_commands:
-                if dangerous in command.lower():
-                    return f"[ERROR] Dangerous command blocked: {dangerous}"
+            match = self._danger_re.search(command)
+            if match:
+                return f"[ERROR] Dangerous command blocked: {match.group(0).lower()}"
 
         try:
-            # Execute command
-            result = subprocess.run(
+            # Execute command without blocking the event loop, so other tool
+            # calls can run alongside it
+            proc = await asyncio.create_subprocess_shell(
                 command,
-                shell=True,
                 cwd=self.workspace,
-                capture_output=True,
-                text=True,
-                timeout=30
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                # Own process group, so the whole pipeline can be killed
+                start_new_session=True
             )
-
-            output = result.stdout
-            if result.stderr:
-                output += f"\n[STDERR]\n{result.stderr}"
-
-            if result.returncode != 0:
-                output += f"\n[EXIT CODE: {result.returncode}]"
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=30)
+            except asyncio.TimeoutError:
+                return "[ERROR] Command timed out after 30 seconds"
+            finally:
+                # Also reached when the turn cancels this call, so the command
+                # never outlives it
+                if proc.returncode is None:
+                    _kill_process_group(proc)
+                    await proc.wait()
+
+            output = stdout.decode('utf-8', errors='replace')
+            if stderr:
+                output += f"\n[STDERR]\n{stderr.decode('utf-8', errors='replace')}"
+
+            if proc.returncode != 0:
+                output += f"\n[EXIT CODE: {proc.returncode}]"
 
             return output if output else "[Command executed successfully with no output]"
 
-        except subprocess.TimeoutExpired:
-            return "[ERROR] Command timed out after 30 seconds"
         except Exception as e:
             return f"[ERROR] Failed to execute command: {str(e)}"
 
@@ -118,8 +216,17 @@ class ShellTool(Tool):
 class FileSystemTool(Tool):
     """Read and write files in the workspace"""
 
+    cacheable = True
+    cache_key_fields = ("path",)
+
     def __init__(self, workspace: str):
         self.workspace = workspace
+        # Resolved once; paths are checked against it on every call
+        self._workspace_root = Path(workspace).resolve()
+        self._workspace_root_str = str(self._workspace_root)
+
+    def cache_version(self, path: str = "", **kwargs) -> Any:
+        return _mtime_ns(self.workspace, path)
 
     def get_name(self) -> str:
         return "read_file"
@@ -141,23 +248,43 @@ class FileSystemTool(Tool):
 
     async def execute(self, path: str, **kwargs) -> str:
         """Read a file"""
-        try:
-            file_path = Path(self.workspace) / path
+        # Blocking file IO runs in a worker thread, off the event loop
+        return await asyncio.to_thread(self._read, path)
 
-            # Security: prevent path traversal
-            if not str(file_path.resolve()).startswith(str(Path(self.workspace).resolve())):
+    def _read(self, path: str) -> str:
+        try:
+            # Security: prevent path traversal (the separator stops /work
+            # from also admitting /work-other)
+            file_path = _within_workspace(self._workspace_root, self._workspace_root_str + os.sep, path)
+            if file_path is None:
                 return "[ERROR] Access denied: path outside workspace"
 
-            if not file_path.exists():
+            try:
+                fd = os.open(file_path, os.O_RDONLY)
+            except FileNotFoundError:
                 return f"[ERROR] File not found: {path}"
 
-            if not file_path.is_file():
-                return f"[ERROR] Not a file: {path}"
-
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            return content
+            try:
+                st = os.fstat(fd)
+                if not stat.S_ISREG(st.st_mode):
+                    return f"[ERROR] Not a file: {path}"
+                if st.st_size > MAX_READ_BYTES:
+                    return f"[ERROR] File too large: {path} ({st.st_size} bytes, limit {MAX_READ_BYTES})"
+
+                # The size is known, so read it in one call (looping only on
+                # short reads) and decode once
+                chunks = []
+                remaining = st.st_size
+                while remaining > 0:
+                    chunk = os.read(fd, remaining)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    remaining -= len(chunk)
+            finally:
+                os.close(fd)
+
+            return b"".join(chunks).decode('utf-8', errors='replace')
 
         except Exception as e:
             return f"[ERROR] Failed to read file: {str(e)}"
@@ -168,6 +295,9 @@ class WriteFileTool(Tool):
 
     def __init__(self, workspace: str):
         self.workspace = workspace
+        # Resolved once; paths are checked against it on every call
+        self._workspace_root = Path(workspace).resolve()
+        self._workspace_root_str = str(self._workspace_root)
 
     def get_name(self) -> str:
         return "write_file"
@@ -193,18 +323,24 @@ class WriteFileTool(Tool):
 
     async def execute(self, path: str, content: str, **kwargs) -> str:
         """Write a file"""
-        try:
-            file_path = Path(self.workspace) / path
+        # Blocking file IO runs in a worker thread, off the event loop
+        return await asyncio.to_thread(self._write, path, content)
 
-            # Security: prevent path traversal
-            if not str(file_path.resolve()).startswith(str(Path(self.workspace).resolve())):
+    def _write(self, path: str, content: str) -> str:
+        try:
+            # Security: prevent path traversal (the separator stops /work
+            # from also admitting /work-other)
+            file_path = _within_workspace(self._workspace_root, self._workspace_root_str + os.sep, path)
+            if file_path is None:
                 return "[ERROR] Access denied: path outside workspace"
 
             # Create parent directories
             file_path.parent.mkdir(parents=True, exist_ok=True)
 
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            # Binary mode skips the text codec layer; a large buffer keeps
+            # multi-MB outputs to a few syscalls
+            with open(file_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(content.encode('utf-8'))
 
             return f"[SUCCESS] File written: {path} ({len(content)} bytes)"
 
@@ -212,11 +348,21 @@ class WriteFileTool(Tool):
             return f"[ERROR] Failed to write file: {str(e)}"
 
 
+_entry_name = attrgetter("name")
+
+
 class ListFilesTool(Tool):
     """List files in a directory"""
 
+    # Listing is cheap next to keeping a cache of it fresh (sizes change
+    # without the directory's mtime moving), so it always runs
+    read_only = True
+
     def __init__(self, workspace: str):
         self.workspace = workspace
+        # Resolved once; paths are checked against it on every call
+        self._workspace_root = Path(workspace).resolve()
+        self._workspace_root_str = str(self._workspace_root)
 
     def get_name(self) -> str:
         return "list_files"
@@ -232,30 +378,53 @@ class ListFilesTool(Tool):
                     "type": "string",
                     "description": "Relative path from workspace root (default: root)",
                     "default": "."
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Maximum number of entries to return, in name order (default: all)",
+                    "minimum": 1
                 }
             }
         }
 
-    async def execute(self, path: str = ".", **kwargs) -> str:
+    async def execute(self, path: str = ".", limit: Optional[int] = None, **kwargs) -> str:
         """List directory contents"""
+        # Models sometimes send numbers as strings
         try:
-            dir_path = Path(self.workspace) / path
+            limit = int(limit) if limit is not None else None
+        except (TypeError, ValueError):
+            return f"[ERROR] Invalid limit: {limit}"
 
-            # Security: prevent path traversal
-            if not str(dir_path.resolve()).startswith(str(Path(self.workspace).resolve())):
+        try:
+            # Security: prevent path traversal (the separator stops /work
+            # from also admitting /work-other)
+            dir_path = _within_workspace(self._workspace_root, self._workspace_root_str + os.sep, path)
+            if dir_path is None:
                 return "[ERROR] Access denied: path outside workspace"
 
-            if not dir_path.exists():
+            # scandir answers is_dir()/is_file() from the dirent type, so only
+            # regular files need a stat() for their size. With a limit only
+            # the first entries by name are kept (O(N log K), no full sort).
+            try:
+                with os.scandir(dir_path) as it:
+                    if limit is not None and limit > 0:
+                        entries = heapq.nsmallest(limit, it, key=_entry_name)
+                    else:
+                        entries = sorted(it, key=_entry_name)
+            except FileNotFoundError:
                 return f"[ERROR] Directory not found: {path}"
-
-            if not dir_path.is_dir():
+            except NotADirectoryError:
                 return f"[ERROR] Not a directory: {path}"
 
-            items = []
-            for item in sorted(dir_path.iterdir()):
-                item_type = "DIR" if item.is_dir() else "FILE"
-                size = item.stat().st_size if item.is_file() else "-"
-                items.append(f"{item_type:4} {size:>10} {item.name}")
+            items = [""] * len(entries)
+            for i, entry in enumerate(entries):
+                if entry.is_dir():
+                    item_type, size = "DIR", "-"
+                elif entry.is_file():
+                    item_type, size = "FILE", entry.stat().st_size
+                else:
+                    item_type, size = "FILE", "-"
+                items[i] = f"{item_type:4} {size:>10} {entry.name}"
 
             if not items:
                 return "[Directory is empty]"
@@ -269,6 +438,10 @@ class ListFilesTool(Tool):
 class WebSearchTool(Tool):
     """Search the web using Brave Search API"""
 
+    # Results expire with the registry cache TTL
+    cacheable = True
+    cache_key_fields = ("query", "count")
+
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key
 
@@ -301,38 +474,37 @@ class WebSearchTool(Tool):
             return "[ERROR] Web search API key not configured"
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://api.search.brave.com/res/v1/web/search",
-                    headers={
-                        "Accept": "application/json",
-                        "X-Subscription-Token": self.api_key
-                    },
-                    params={
-                        "q": query,
-                        "count": count
-                    },
-                    timeout=10.0
-                )
+            response = await _HTTP_CLIENT.get(
+                "https://api.search.brave.com/res/v1/web/search",
+                headers={
+                    "Accept": "application/json",
+                    "X-Subscription-Token": self.api_key
+                },
+                params={
+                    "q": query,
+                    "count": count
+                },
+                timeout=10.0
+            )
 
-                if response.status_code != 200:
-                    return f"[ERROR] Search API returned status {response.status_code}"
+            if response.status_code != 200:
+                return f"[ERROR] Search API returned status {response.status_code}"
 
-                data = response.json()
-                results = data.get("web", {}).get("results", [])
+            data = response.json()
+            results = data.get("web", {}).get("results", [])
 
-                if not results:
-                    return "[No results found]"
+            if not results:
+                return "[No results found]"
 
-                formatted_results = []
-                for i, result in enumerate(results[:count], 1):
-                    formatted_results.append(
-                        f"{i}. {result.get('title', 'No title')}\n"
-                        f"   URL: {result.get('url', '')}\n"
-                        f"   {result.get('description', 'No description')}"
-                    )
+            formatted_results = []
+            for i, result in enumerate(results[:count], 1):
+                formatted_results.append(
+                    f"{i}. {result.get('title', 'No title')}\n"
+                    f"   URL: {result.get('url', '')}\n"
+                    f"   {result.get('description', 'No description')}"
+                )
 
-                return "\n\n".join(formatted_results)
+            return "\n\n".join(formatted_results)
 
         except Exception as e:
             return f"[ERROR] Search failed: {str(e)}"
@@ -344,6 +516,8 @@ class MemoryTool(Tool):
     def __init__(self, workspace: str):
         self.workspace = workspace
         self.memory_file = Path(workspace) / "memory" / "MEMORY.md"
+        # ((mtime_ns, size), content) of the last read; appends always change both
+        self._read_cache: Optional[Tuple[Tuple[int, int], str]] = None
 
     def get_name(self) -> str:
         return "memory"
@@ -370,25 +544,47 @@ class MemoryTool(Tool):
 
     async def execute(self, action: str, content: str = "", **kwargs) -> str:
         """Read or write memory"""
+        # Blocking file IO runs in a worker thread, off the event loop
+        return await asyncio.to_thread(self._run, action, content)
+
+    def _run(self, action: str, content: str) -> str:
         try:
             # Ensure memory directory exists
             self.memory_file.parent.mkdir(parents=True, exist_ok=True)
 
             if action == "read":
-                if not self.memory_file.exists():
+                try:
+                    st = os.stat(self.memory_file)
+                except FileNotFoundError:
                     return "[Memory is empty]"
 
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    return f.read()
+                # Unchanged since the last read: skip the read and decode
+                key = (st.st_mtime_ns, st.st_size)
+                if self._read_cache is not None and self._read_cache[0] == key:
+                    return self._read_cache[1]
+
+                with open(self.memory_file, 'rb') as f:
+                    memory = f.read().decode('utf-8')
+                self._read_cache = (key, memory)
+                return memory
 
             elif action == "append":
                 if not content:
                     return "[ERROR] Content required for append action"
 
-                with open(self.memory_file, 'a', encoding='utf-8') as f:
-                    from datetime import datetime
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    f.write(f"\n\n---\n[{timestamp}]\n{content}\n")
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                chunks = [f"\n\n---\n[{timestamp}]\n".encode(), content.encode('utf-8'), b"\n"]
+
+                if hasattr(os, "writev"):
+                    # Header, entry and trailer in a single O_APPEND syscall
+                    fd = os.open(self.memory_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                    try:
+                        os.writev(fd, chunks)
+                    finally:
+                        os.close(fd)
+                else:
+                    with open(self.memory_file, 'ab', buffering=WRITE_BUFFER_SIZE) as f:
+                        f.write(b"".join(chunks))
 
                 return "[SUCCESS] Memory updated"
 
@@ -402,24 +598,62 @@ class MemoryTool(Tool):
 class ToolRegistry:
     """Registry to manage all tools"""
 
-    def __init__(self):
+    def __init__(self, cache_size: int = 256, cache_ttl: float = 300):
         self.tools: Dict[str, Tool] = {}
+        self._version = 0
+
+        # Derived from the registered tools; reset by register()
+        self._def_cache: Optional[List[Dict[str, Any]]] = None
+        self._anthropic_cache: Optional[List[Dict[str, Any]]] = None
+        self._sum_cache: Optional[List[str]] = None
+
+        # Memoized results of cacheable tools: (name, args digest, version) -> result
+        self._result_cache: TTLCache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    @property
+    def version(self) -> int:
+        """Counter bumped on every registration, used to invalidate caches"""
+        return self._version
 
     def register(self, tool: Tool):
         """Register a new tool"""
         self.tools[tool.get_name()] = tool
+        self._version += 1
+        self._def_cache = None
+        self._anthropic_cache = None
+        self._sum_cache = None
 
     def get(self, name: str) -> Optional[Tool]:
         """Get a tool by name"""
         return self.tools.get(name)
 
     def get_definitions(self) -> List[Dict[str, Any]]:
-        """Get all tool definitions for LLM"""
-        return [tool.get_definition() for tool in self.tools.values()]
+        """Get all tool definitions for LLM, rebuilt only after register()"""
+        if self._def_cache is None:
+            self._def_cache = [tool.get_definition() for tool in self.tools.values()]
+        return self._def_cache
+
+    def get_openai_definitions(self) -> List[Dict[str, Any]]:
+        """Get all tool definitions in OpenAI function-calling format"""
+        return self.get_definitions()
+
+    def get_anthropic_definitions(self) -> List[Dict[str, Any]]:
+        """Get all tool definitions in Anthropic format, rebuilt only after register()"""
+        if self._anthropic_cache is None:
+            self._anthropic_cache = [tool.get_anthropic_definition() for tool in self.tools.values()]
+        return self._anthropic_cache
+
+    def get_definitions_for(self, tool_format: str) -> List[Dict[str, Any]]:
+        """Get all tool definitions in a provider's native format"""
+        if tool_format == "anthropic":
+            return self.get_anthropic_definitions()
+        return self.get_openai_definitions()
 
     def get_summaries(self) -> List[str]:
-        """Get summaries of all tools"""
-        return [tool.get_summary() for tool in self.tools.values()]
+        """Get summaries of all tools, rebuilt only after register()"""
+        if self._sum_cache is None:
+            self._sum_cache = [tool.get_summary() for tool in self.tools.values()]
+        return self._sum_cache
 
     def list_tools(self) -> List[str]:
         """List all tool names"""
@@ -427,8 +661,46 @@ class ToolRegistry:
 
     async def execute(self, name: str, **kwargs) -> str:
         """Execute a tool by name"""
+        result, _ = await self.execute_cached(name, **kwargs)
+        return result
+
+    async def execute_cached(self, name: str, **kwargs) -> Tuple[str, bool]:
+        """Execute a tool by name, returning (result, served_from_cache)"""
         tool = self.get(name)
         if not tool:
-            return f"[ERROR] Tool not found: {name}"
-
-        return await tool.execute(**kwargs)
+            return f"[ERROR] Tool not found: {name}", False
+
+        if not tool.cacheable:
+            result = await tool.execute(**kwargs)
+            # Side-effecting tools (shell, writes) may change what a cached
+            # read would return
+            if not tool.read_only:
+                self._result_cache.clear()
+            return result, False
+
+        # The version usually needs a stat, so keep it off the event loop;
+        # tools without one skip the thread hop
+        version = None
+        if type(tool).cache_version is not Tool.cache_version:
+            version = await asyncio.to_thread(tool.cache_version, **kwargs)
+
+        key = self._cache_key(tool, name, kwargs, version)
+        cached = self._result_cache.get(key)
+        if cached is not None:
+            return cached, True
+
+        result = await tool.execute(**kwargs)
+        if not result.startswith("[ERROR]"):
+            self._result_cache[key] = result
+        return result, False
+
+    def _cache_key(self, tool: Tool, name: str, kwargs: Dict[str, Any], version: Any) -> Tuple[Any, ...]:
+        """Build the memoization key for a cacheable tool call"""
+        fields = kwargs
+        if tool.cache_key_fields:
+            fields = {k: kwargs.get(k) for k in tool.cache_key_fields}
+        digest = hashlib.blake2b(
+            json.dumps(fields, sort_keys=True, default=str).encode(),
+            digest_size=16
+        ).digest()
+        return (name, digest, version)
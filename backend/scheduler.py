@@ -8,14 +8,93 @@ from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.date import DateTrigger
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from bson.objectid import ObjectId
 from datetime import datetime
+from functools import lru_cache
 import asyncio
 import logging
+import re
 from typing import Dict, List, Any, Optional
-import subprocess
+import aiohttp
 
 logger = logging.getLogger(__name__)
 
+# Fields the scheduler and job handlers read; status/result fields are skipped
+SCHEDULE_PROJECTION = {
+    "_id": 1, "job_type": 1, "trigger_type": 1, "trigger_config": 1, "name": 1, "config": 1
+}
+
+# Job status updates are written in bulk: up to this many per write, gathered
+# for at most UPDATE_FLUSH_INTERVAL seconds after the first one arrives
+UPDATE_BATCH_SIZE = 100
+UPDATE_FLUSH_INTERVAL = 0.05
+
+# Shared session for webhook jobs, so repeat calls reuse keep-alive connections.
+# Created lazily: an aiohttp session must be created inside the running loop.
+_webhook_session: Optional[aiohttp.ClientSession] = None
+
+
+def _get_webhook_session() -> aiohttp.ClientSession:
+    """Get the shared webhook session, creating it on first use"""
+    global _webhook_session
+    if _webhook_session is None or _webhook_session.closed:
+        _webhook_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=1000, keepalive_timeout=30)
+        )
+    return _webhook_session
+
+
+async def close_webhook_session():
+    """Close the shared webhook session"""
+    global _webhook_session
+    if _webhook_session is not None:
+        await _webhook_session.close()
+        _webhook_session = None
+
+
+@lru_cache(maxsize=1024)
+def _cached_cron(minute, hour, day, month, day_of_week) -> CronTrigger:
+    """
+    Build a CronTrigger once per distinct schedule
+
+    Triggers hold no per-job state, so jobs sharing a schedule (e.g. "every
+    5 minutes") can share the parsed instance.
+    """
+    return CronTrigger(minute=minute, hour=hour, day=day, month=month, day_of_week=day_of_week)
+
+
+def _make_cron(config: Dict) -> CronTrigger:
+    return _cached_cron(
+        config.get("minute", "*"),
+        config.get("hour", "*"),
+        config.get("day", "*"),
+        config.get("month", "*"),
+        config.get("day_of_week", "*")
+    )
+
+
+def _make_interval(config: Dict) -> IntervalTrigger:
+    return IntervalTrigger(
+        seconds=config.get("seconds", 0),
+        minutes=config.get("minutes", 0),
+        hours=config.get("hours", 0),
+        days=config.get("days", 0)
+    )
+
+
+def _make_date(config: Dict) -> DateTrigger:
+    run_date = datetime.fromisoformat(config.get("run_date"))
+    return DateTrigger(run_date=run_date)
+
+
+_TRIGGER_FACTORIES = {
+    "cron": _make_cron,
+    "interval": _make_interval,
+    "date": _make_date,
+}
+
+
 class JobScheduler:
     """Manages scheduled jobs for the MGS Codec Dashboard"""
 
@@ -23,11 +102,34 @@ class JobScheduler:
         self.scheduler = AsyncIOScheduler()
         self.db = db
         self.jobs_collection = db.scheduled_jobs
+        self._update_queue: asyncio.Queue = asyncio.Queue()
+        self._flush_task: Optional[asyncio.Task] = None
+        # Block dangerous commands: all patterns in one case-insensitive regex
+        dangerous_patterns = [
+            "rm -rf /",
+            "mkfs",
+            "dd if=",
+            ":(){ :|:& };:",  # Fork bomb
+            "chmod -R 777 /",
+            "shutdown",
+            "reboot",
+            "init 0",
+            "init 6"
+        ]
+        self._danger_re = re.compile(
+            "|".join(re.escape(p) for p in dangerous_patterns), re.IGNORECASE
+        )
+        self._job_handlers = {
+            "agent_task": self._execute_agent_task,
+            "shell_command": self._execute_shell_command,
+            "webhook": self._execute_webhook,
+        }
 
     def start(self):
         """Start the scheduler"""
         if not self.scheduler.running:
             self.scheduler.start()
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_updates())
             logger.info("Job scheduler started")
 
     def shutdown(self):
@@ -36,12 +138,41 @@ class JobScheduler:
             self.scheduler.shutdown()
             logger.info("Job scheduler stopped")
 
+    async def close(self):
+        """Stop the status writer once every queued update is written"""
+        if self._flush_task is not None:
+            self._update_queue.put_nowait(None)
+            await self._flush_task
+            self._flush_task = None
+
     async def load_jobs_from_db(self):
         """Load all scheduled jobs from database and schedule them"""
-        jobs = await self.jobs_collection.find({"enabled": True}).to_list(length=None)
-        for job_data in jobs:
-            await self._schedule_job_from_data(job_data)
-        logger.info(f"Loaded {len(jobs)} scheduled jobs from database")
+        jobs = await self.jobs_collection.find(
+            {"enabled": True}, projection=SCHEDULE_PROJECTION
+        ).to_list(length=None)
+
+        # Add jobs while paused: a running scheduler wakes its main loop on every
+        # add_job(), a paused one only once on resume()
+        pause = self.scheduler.running
+        if pause:
+            self.scheduler.pause()
+        try:
+            # One malformed job (e.g. a bad trigger config) must not keep the
+            # rest from being scheduled
+            results = await asyncio.gather(
+                *(self._schedule_job_from_data(job_data) for job_data in jobs),
+                return_exceptions=True
+            )
+        finally:
+            if pause:
+                self.scheduler.resume()
+
+        failed = 0
+        for job_data, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error(f"Failed to schedule job {job_data.get('_id')}: {str(result)}")
+        logger.info(f"Loaded {len(jobs) - failed} scheduled jobs from database")
 
     async def _schedule_job_from_data(self, job_data: Dict):
         """Schedule a job based on database data"""
@@ -53,56 +184,25 @@ class JobScheduler:
         trigger = self._create_trigger(trigger_type, job_data.get("trigger_config", {}))
 
         # Schedule job based on type
-        if job_type == "agent_task":
-            self.scheduler.add_job(
-                self._execute_agent_task,
-                trigger=trigger,
-                args=[job_data],
-                id=job_id,
-                name=job_data.get("name", "Unnamed Job"),
-                replace_existing=True
-            )
-        elif job_type == "shell_command":
-            self.scheduler.add_job(
-                self._execute_shell_command,
-                trigger=trigger,
-                args=[job_data],
-                id=job_id,
-                name=job_data.get("name", "Unnamed Job"),
-                replace_existing=True
-            )
-        elif job_type == "webhook":
-            self.scheduler.add_job(
-                self._execute_webhook,
-                trigger=trigger,
-                args=[job_data],
-                id=job_id,
-                name=job_data.get("name", "Unnamed Job"),
-                replace_existing=True
-            )
+        handler = self._job_handlers.get(job_type)
+        if handler is None:
+            return
+
+        self.scheduler.add_job(
+            handler,
+            trigger=trigger,
+            args=[job_data],
+            id=job_id,
+            name=job_data.get("name", "Unnamed Job"),
+            replace_existing=True
+        )
 
     def _create_trigger(self, trigger_type: str, config: Dict):
         """Create scheduler trigger from configuration"""
-        if trigger_type == "cron":
-            return CronTrigger(
-                minute=config.get("minute", "*"),
-                hour=config.get("hour", "*"),
-                day=config.get("day", "*"),
-                month=config.get("month", "*"),
-                day_of_week=config.get("day_of_week", "*")
-            )
-        elif trigger_type == "interval":
-            return IntervalTrigger(
-                seconds=config.get("seconds", 0),
-                minutes=config.get("minutes", 0),
-                hours=config.get("hours", 0),
-                days=config.get("days", 0)
-            )
-        elif trigger_type == "date":
-            run_date = datetime.fromisoformat(config.get("run_date"))
-            return DateTrigger(run_date=run_date)
-        else:
+        factory = _TRIGGER_FACTORIES.get(trigger_type)
+        if factory is None:
             raise ValueError(f"Unknown trigger type: {trigger_type}")
+        return factory(config)
 
     async def _execute_agent_task(self, job_data: Dict):
         """Execute an agent task"""
@@ -155,19 +255,23 @@ class JobScheduler:
 
             # Execute command (with safety checks)
             if self._is_safe_command(command):
-                result = subprocess.run(
+                proc = await asyncio.create_subprocess_shell(
                     command,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=60
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
                 )
+                try:
+                    stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=60)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+                    raise TimeoutError("Command timed out after 60 seconds")
 
-                output = result.stdout if result.returncode == 0 else result.stderr
+                output = (stdout if proc.returncode == 0 else stderr).decode('utf-8', errors='replace')
 
                 await self._update_job_execution(
                     str(job_data["_id"]),
-                    status="completed" if result.returncode == 0 else "failed",
+                    status="completed" if proc.returncode == 0 else "failed",
                     last_result=output[:500]  # Limit to 500 chars
                 )
             else:
@@ -193,22 +297,20 @@ class JobScheduler:
                 last_run=datetime.utcnow()
             )
 
-            import aiohttp
-
             url = job_data.get("config", {}).get("url")
             method = job_data.get("config", {}).get("method", "GET")
             headers = job_data.get("config", {}).get("headers", {})
             data = job_data.get("config", {}).get("data", {})
 
-            async with aiohttp.ClientSession() as session:
-                async with session.request(method, url, headers=headers, json=data) as response:
-                    result_text = await response.text()
+            session = _get_webhook_session()
+            async with session.request(method, url, headers=headers, json=data) as response:
+                result_text = await response.text()
 
-                    await self._update_job_execution(
-                        str(job_data["_id"]),
-                        status="completed" if response.status < 400 else "failed",
-                        last_result=f"Status: {response.status}, Response: {result_text[:500]}"
-                    )
+                await self._update_job_execution(
+                    str(job_data["_id"]),
+                    status="completed" if response.status < 400 else "failed",
+                    last_result=f"Status: {response.status}, Response: {result_text[:500]}"
+                )
 
         except Exception as e:
             logger.error(f"Failed to execute webhook: {str(e)}")
@@ -221,32 +323,56 @@ class JobScheduler:
     def _is_safe_command(self, command: str) -> bool:
         """Check if command is safe to execute"""
         # Block dangerous commands
-        dangerous_patterns = [
-            "rm -rf /",
-            "mkfs",
-            "dd if=",
-            ":(){ :|:& };:",  # Fork bomb
-            "chmod -R 777 /",
-            "shutdown",
-            "reboot",
-            "init 0",
-            "init 6"
-        ]
-
-        command_lower = command.lower()
-        for pattern in dangerous_patterns:
-            if pattern.lower() in command_lower:
-                return False
-
-        return True
+        return self._danger_re.search(command) is None
 
     async def _update_job_execution(self, job_id: str, **updates):
-        """Update job execution status in database"""
-        from bson.objectid import ObjectId
-        await self.jobs_collection.update_one(
-            {"_id": ObjectId(job_id)},
-            {"$set": updates}
-        )
+        """Queue a job execution status update for the next bulk write"""
+        self._update_queue.put_nowait((job_id, updates))
+
+    async def _flush_updates(self):
+        """Drain queued status updates into bulk writes until close() queues None"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._update_queue.get()
+            if item is None:
+                return
+
+            # Later updates to the same job win, so a run's start and end
+            # collapse into one $set
+            pending: Dict[str, Dict] = {}
+            count = 0
+            closing = False
+            deadline = loop.time() + UPDATE_FLUSH_INTERVAL
+
+            while True:
+                job_id, updates = item
+                pending.setdefault(job_id, {}).update(updates)
+                count += 1
+
+                timeout = deadline - loop.time()
+                if count >= UPDATE_BATCH_SIZE or timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._update_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+
+            await self._write_updates(pending)
+            if closing:
+                return
+
+    async def _write_updates(self, pending: Dict[str, Dict]):
+        """Write coalesced status updates in a single unordered bulk write"""
+        try:
+            await self.jobs_collection.bulk_write(
+                [UpdateOne({"_id": ObjectId(job_id)}, {"$set": updates}) for job_id, updates in pending.items()],
+                ordered=False
+            )
+        except Exception as e:
+            logger.error(f"Failed to write job status updates: {str(e)}")
 
     async def create_job(self, job_data: Dict) -> str:
         """Create a new scheduled job"""
@@ -268,8 +394,6 @@ class JobScheduler:
 
     async def delete_job(self, job_id: str):
         """Delete a scheduled job"""
-        from bson.objectid import ObjectId
-
         # Remove from scheduler
         try:
             self.scheduler.remove_job(job_id)
@@ -281,7 +405,6 @@ class JobScheduler:
 
     async def toggle_job(self, job_id: str, enabled: bool):
         """Enable or disable a job"""
-        from bson.objectid import ObjectId
 
         await self.jobs_collection.update_one(
             {"_id": ObjectId(job_id)},
@@ -300,9 +423,13 @@ class JobScheduler:
             except:
                 pass
 
-    async def list_jobs(self) -> List[Dict]:
-        """List all scheduled jobs"""
-        jobs = await self.jobs_collection.find().to_list(length=None)
+    async def list_jobs(self, limit: Optional[int] = None) -> List[Dict]:
+        """List scheduled jobs (all of them unless limit is given)"""
+        # Fetch in batches of 100 so a large collection isn't one big BSON decode
+        cursor = self.jobs_collection.find().batch_size(100)
+        if limit:
+            cursor = cursor.limit(limit)
+        jobs = await cursor.to_list(length=limit or None)
 
         # Add next run time from scheduler
         for job in jobs:
@@ -320,7 +447,6 @@ class JobScheduler:
 
     async def get_job(self, job_id: str) -> Optional[Dict]:
         """Get a specific job"""
-        from bson.objectid import ObjectId
         job = await self.jobs_collection.find_one({"_id": ObjectId(job_id)})
         if job:
             job["_id"] = str(job["_id"])
@@ -1,24 +1,32 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from pydantic import BaseModel
+from typing import List, Optional, Dict, Any, Set, Tuple, Callable, Awaitable, Union
+from dataclasses import dataclass
+from collections import OrderedDict
+from functools import lru_cache
+from cachetools import TTLCache
 from cryptography.fernet import Fernet
+import asyncio
 import os
+import time
 import uuid
 import httpx
-import json
+import msgspec
+import orjson
 
 # PicoClaw Agent Integration
 from picoclaw_agent import create_default_agent
 from picoclaw_agent.providers import Message as PicoMessage
+from picoclaw_agent.tools import aclose_http_client
 
 # Job Scheduler
 from scheduler import JobScheduler, job_scheduler as global_scheduler
 import scheduler as scheduler_module
 
-app = FastAPI(title="OpenClaw MGS Codec API")
+app = FastAPI(title="OpenClaw MGS Codec API", default_response_class=ORJSONResponse)
 
 # CORS configuration
 app.add_middleware(
@@ -34,76 +42,177 @@ MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/openclaw_db")
 client = AsyncIOMotorClient(MONGO_URL)
 db = client.openclaw_db
 
+# Shared HTTP/2 connection pool for LLM provider calls, so agents created per
+# request reuse TCP/TLS sessions. The transport retries failed connection
+# attempts; HTTP-level retries stay in the providers.
+HTTP_CLIENT = httpx.AsyncClient(
+    timeout=60.0,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+)
+
 # Encryption for API keys
 SECRET_KEY = os.getenv("SECRET_KEY", Fernet.generate_key().decode())
 cipher_suite = Fernet(SECRET_KEY.encode() if len(SECRET_KEY) == 44 else Fernet.generate_key())
 
+@lru_cache(maxsize=8)
+def _decrypt_token(ciphertext: str) -> str:
+    """Decrypt a stored token; memoized so the stored token is decrypted once"""
+    return cipher_suite.decrypt(ciphertext.encode()).decode()
+
+# Outbound messages buffered per client; a client that falls this far
+# behind is dropped instead of slowing down everyone else's broadcasts
+CLIENT_QUEUE_SIZE = 32
+
+# Envelopes for the frequent broadcasts; orjson serializes slotted dataclasses
+# directly, so no intermediate dict is built
+@dataclass(slots=True)
+class BroadcastEnvelope:
+    type: str
+    conversation_id: str
+    message: Dict[str, Any]
+
+@dataclass(slots=True)
+class TokenEnvelope:
+    type: str
+    conversation_id: str
+    delta: str
+
+# Raised by sends on a closed or broken socket: Starlette raises RuntimeError
+# once the socket is closed, servers raise OSError subclasses on resets
+SOCKET_ERRORS = (WebSocketDisconnect, RuntimeError, OSError)
+
 # WebSocket connection manager
 class ConnectionManager:
+    __slots__ = ("active_connections", "_closing")
+
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # websocket -> (outbound queue, relay task draining it)
+        self.active_connections: Dict[WebSocket, Tuple[asyncio.Queue, asyncio.Task]] = {}
+        self._closing: Set[asyncio.Task] = set()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        relay = asyncio.create_task(self._relay(websocket, queue))
+        self.active_connections[websocket] = (queue, relay)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
+        entry = self.active_connections.pop(websocket, None)
+        if entry is None:
+            return
+        queue, relay = entry
+        if relay is not asyncio.current_task():
+            relay.cancel()
+        while not queue.empty():
+            queue.get_nowait()
+
+    async def _relay(self, websocket: WebSocket, queue: asyncio.Queue):
+        # Payloads are UTF-8 JSON encoded once per broadcast; sending them as
+        # binary frames skips a decode/re-encode per client
+        try:
+            while True:
+                payload = await queue.get()
+                await websocket.send_bytes(payload)
+        except SOCKET_ERRORS:
+            # A failed send means the client is gone; stop broadcasting to it
+            self.disconnect(websocket)
+
+    def _drop(self, websocket: WebSocket):
+        self.disconnect(websocket)
+        task = asyncio.create_task(self._close(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # try again later
+        except SOCKET_ERRORS:
+            pass
+
+    async def broadcast(self, message: Union[dict, BroadcastEnvelope, TokenEnvelope]):
+        # Encode once for all clients; each client's relay task does the
+        # actual send
+        payload = orjson.dumps(message)
+        for websocket, (queue, _) in list(self.active_connections.items()):
             try:
-                await connection.send_json(message)
-            except:
-                pass
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                self._drop(websocket)
 
 manager = ConnectionManager()
 
-# Pydantic models
-class Agent(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+def _now_ms() -> int:
+    """Current UTC time as epoch milliseconds (the stored timestamp format)"""
+    return time.time_ns() // 1_000_000
+
+def _new_id() -> str:
+    return str(uuid.uuid4())
+
+# Stored record types. msgspec structs: built without per-field validation
+# from trusted code, converted from Mongo documents and encoded to JSON in C.
+# Pydantic stays at the request-body boundary.
+class Agent(msgspec.Struct, kw_only=True):
+    id: str = msgspec.field(default_factory=_new_id)
     name: str
     type: str
     status: str = "offline"  # connected, busy, alert, offline
     avatar: str = "default"
     frequency: str = "187.89"
-    last_activity: Optional[datetime] = None
+    last_activity: Optional[int] = None  # epoch millis
     capabilities: List[str] = []
     description: str = ""
 
-class Message(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+class Message(msgspec.Struct, kw_only=True):
+    id: str = msgspec.field(default_factory=_new_id)
     conversation_id: str
     role: str  # user, agent, system
     content: str
     agent_id: Optional[str] = None
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    timestamp: int = msgspec.field(default_factory=_now_ms)  # epoch millis
     metadata: Dict[str, Any] = {}
 
-class Conversation(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+class ConversationSummary(msgspec.Struct, kw_only=True):
+    """Conversation metadata without the message transcript (list views)"""
+    id: str = msgspec.field(default_factory=_new_id)
     agent_id: str
     title: str = "New Codec Call"
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-    messages: List[Message] = []
-    metrics: Dict[str, Any] = {
+    created_at: int = msgspec.field(default_factory=_now_ms)  # epoch millis
+    updated_at: int = msgspec.field(default_factory=_now_ms)
+    metrics: Dict[str, Any] = msgspec.field(default_factory=lambda: {
         "tokens_used": 0,
         "cost": 0.0,
         "duration": 0,
         "status": "active"
-    }
+    })
 
-class UserConfig(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+class Conversation(ConversationSummary, kw_only=True):
+    messages: List[Message] = []
+
+class UserConfig(msgspec.Struct, kw_only=True):
+    id: str = msgspec.field(default_factory=_new_id)
     openclaw_token: Optional[str] = None
-    settings: Dict[str, Any] = {
+    settings: Dict[str, Any] = msgspec.field(default_factory=lambda: {
         "sound_enabled": True,
         "effects_enabled": True,
         "auto_save": True
-    }
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    })
+    created_at: int = msgspec.field(default_factory=_now_ms)  # epoch millis
+
+_json_encode = msgspec.json.Encoder().encode
+
+class MsgspecJSONResponse(Response):
+    """JSON response for the msgspec record types (and plain containers of them)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return _json_encode(content)
 
+# Pydantic models
 class Metrics(BaseModel):
     tokens_per_minute: float = 0.0
     cost_per_hour: float = 0.0
@@ -112,6 +221,95 @@ class Metrics(BaseModel):
     memory_usage: float = 0.0
     uptime: str = "00:00:00"
 
+# Most recent messages passed to the LLM as conversation history
+HISTORY_LIMIT = 20
+
+# Converted LLM history per conversation (LRU), so each turn appends the new
+# messages instead of re-converting the stored history. Entries are
+# (id of the last stored message, history); a different last id means the
+# conversation changed elsewhere and the entry is rebuilt. The database stays
+# canonical.
+HISTORY_CACHE_SIZE = 1024
+HISTORY_CACHE: "OrderedDict[str, Tuple[Optional[str], List[PicoMessage]]]" = OrderedDict()
+
+_PICO_ROLES = {"user": "user", "agent": "assistant", "assistant": "assistant"}
+
+def _to_pico_history(messages: List[Dict[str, Any]]) -> List[PicoMessage]:
+    """Convert stored messages to PicoClaw history, skipping system messages"""
+    return [
+        PicoMessage(role=_PICO_ROLES[msg["role"]], content=msg["content"])
+        for msg in messages
+        if msg["role"] in _PICO_ROLES
+    ]
+
+def _cached_history(conversation_id: str, messages: List[Dict[str, Any]]) -> List[PicoMessage]:
+    last_id = messages[-1].get("id") if messages else None
+    entry = HISTORY_CACHE.get(conversation_id)
+    if entry is not None and entry[0] == last_id:
+        HISTORY_CACHE.move_to_end(conversation_id)
+        return entry[1]
+    history = _to_pico_history(messages)
+    _store_history(conversation_id, last_id, history)
+    return history
+
+def _extend_history(conversation_id: str, prev_last_id: Optional[str], new_messages: List["Message"]):
+    """Append messages just stored after prev_last_id to the cached history"""
+    entry = HISTORY_CACHE.get(conversation_id)
+    if entry is None or entry[0] != prev_last_id:
+        # Not cached, or another write got in between: rebuild on next read
+        HISTORY_CACHE.pop(conversation_id, None)
+        return
+    added = _to_pico_history([{"role": m.role, "content": m.content} for m in new_messages])
+    _store_history(conversation_id, new_messages[-1].id, (entry[1] + added)[-HISTORY_LIMIT:])
+
+def _store_history(conversation_id: str, last_id: Optional[str], history: List[PicoMessage]):
+    HISTORY_CACHE[conversation_id] = (last_id, history)
+    HISTORY_CACHE.move_to_end(conversation_id)
+    if len(HISTORY_CACHE) > HISTORY_CACHE_SIZE:
+        HISTORY_CACHE.popitem(last=False)
+
+# Mongo documents <-> record types. msgspec.convert ignores extra keys such
+# as _id and builds nested messages in the same C pass.
+def _agent_from_doc(doc: Dict[str, Any]) -> Agent:
+    return msgspec.convert(doc, Agent)
+
+def _summary_from_doc(doc: Dict[str, Any]) -> ConversationSummary:
+    return msgspec.convert(doc, ConversationSummary)
+
+def _conv_from_doc(doc: Dict[str, Any]) -> Conversation:
+    return msgspec.convert(doc, Conversation)
+
+def _config_from_doc(doc: Dict[str, Any]) -> UserConfig:
+    return msgspec.convert(doc, UserConfig)
+
+# Record -> Mongo document (recursive for nested messages)
+_to_doc = msgspec.to_builtins
+# Shallow, for the hot message path
+_message_to_dict = msgspec.structs.asdict
+
+# Statuses counted as active in metrics (served by the agents.status index)
+ACTIVE_AGENT_STATUSES = ["connected", "busy"]
+
+# Agent records and the config document change rarely; reads are served from
+# memory and the writers below invalidate them
+AGENT_CACHE: TTLCache = TTLCache(maxsize=64, ttl=30)
+CONFIG_CACHE: TTLCache = TTLCache(maxsize=1, ttl=60)
+
+async def _get_agent_doc(agent_id: str) -> Optional[Dict[str, Any]]:
+    agent = AGENT_CACHE.get(agent_id)
+    if agent is None:
+        agent = await db.agents.find_one({"id": agent_id})
+        if agent is not None:
+            AGENT_CACHE[agent_id] = agent
+    return agent
+
+async def _get_config_doc() -> Optional[Dict[str, Any]]:
+    try:
+        return CONFIG_CACHE["config"]
+    except KeyError:
+        config = CONFIG_CACHE["config"] = await db.config.find_one({})
+        return config
+
 # Initialize default agents
 DEFAULT_AGENTS = [
     {
@@ -170,14 +368,64 @@ DEFAULT_AGENTS = [
     }
 ]
 
+async def ensure_indexes():
+    """Create the indexes the API queries rely on (no-op when they exist)"""
+    await asyncio.gather(
+        db.agents.create_index("id", unique=True),
+        db.agents.create_index("status"),
+        db.conversations.create_index("id", unique=True),
+        db.conversations.create_index([("updated_at", -1)]),
+    )
+
+async def migrate_timestamps():
+    """
+    Convert BSON dates written by earlier versions to epoch millis
+
+    Idempotent: only documents still holding a date are touched, and $toLong
+    leaves values that are already millis unchanged.
+    """
+    def to_millis(field: str) -> Dict[str, Any]:
+        return {"$toLong": f"${field}"}
+
+    await asyncio.gather(
+        db.agents.update_many(
+            {"last_activity": {"$type": "date"}},
+            [{"$set": {"last_activity": to_millis("last_activity")}}]
+        ),
+        db.config.update_many(
+            {"created_at": {"$type": "date"}},
+            [{"$set": {"created_at": to_millis("created_at")}}]
+        ),
+        db.conversations.update_many(
+            {"$or": [
+                {"created_at": {"$type": "date"}},
+                {"updated_at": {"$type": "date"}},
+                {"messages.timestamp": {"$type": "date"}},
+            ]},
+            [{"$set": {
+                "created_at": to_millis("created_at"),
+                "updated_at": to_millis("updated_at"),
+                "messages": {"$map": {
+                    "input": {"$ifNull": ["$messages", []]},
+                    "as": "m",
+                    "in": {"$mergeObjects": ["$$m", {"timestamp": to_millis("$m.timestamp")}]}
+                }}
+            }}]
+        ),
+    )
+
 @app.on_event("startup")
 async def startup_event():
+    await ensure_indexes()
+    await migrate_timestamps()
+
     # Initialize default agents if not exists
     existing_agents = await db.agents.count_documents({})
     if existing_agents == 0:
-        for agent_data in DEFAULT_AGENTS:
-            agent = Agent(**agent_data)
-            await db.agents.insert_one(agent.dict())
+        await db.agents.insert_many(
+            [_to_doc(Agent(**agent_data)) for agent_data in DEFAULT_AGENTS],
+            ordered=False
+        )
 
     # Initialize job scheduler
     scheduler_module.job_scheduler = JobScheduler(db)
@@ -192,6 +440,12 @@ async def shutdown_event():
     # Shutdown job scheduler
     if scheduler_module.job_scheduler:
         scheduler_module.job_scheduler.shutdown()
+        await scheduler_module.job_scheduler.close()
+
+    # Close shared HTTP connection pools
+    await scheduler_module.close_webhook_session()
+    await aclose_http_client()
+    await HTTP_CLIENT.aclose()
     print("🦞 OpenClaw MGS Codec API shutdown - FREQUENCY LOST")
 
 @app.get("/api/health")
@@ -199,24 +453,25 @@ async def health_check():
     return {"status": "operational", "frequency": "187.89 MHz", "codec": "active"}
 
 # Agent endpoints
-@app.get("/api/agents", response_model=List[Agent])
+@app.get("/api/agents", response_class=MsgspecJSONResponse)
 async def get_agents():
     agents = await db.agents.find().to_list(100)
-    return [Agent(**agent) for agent in agents]
+    return MsgspecJSONResponse([_agent_from_doc(agent) for agent in agents])
 
-@app.get("/api/agents/{agent_id}", response_model=Agent)
+@app.get("/api/agents/{agent_id}", response_class=MsgspecJSONResponse)
 async def get_agent(agent_id: str):
-    agent = await db.agents.find_one({"id": agent_id})
+    agent = await _get_agent_doc(agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
-    return Agent(**agent)
+    return MsgspecJSONResponse(_agent_from_doc(agent))
 
 @app.put("/api/agents/{agent_id}/status")
 async def update_agent_status(agent_id: str, status: str):
     result = await db.agents.update_one(
         {"id": agent_id},
-        {"$set": {"status": status, "last_activity": datetime.utcnow()}}
+        {"$set": {"status": status, "last_activity": _now_ms()}}
     )
+    AGENT_CACHE.pop(agent_id, None)
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Agent not found")
     
@@ -230,28 +485,34 @@ async def update_agent_status(agent_id: str, status: str):
     return {"success": True, "agent_id": agent_id, "status": status}
 
 # Conversation endpoints
-@app.post("/api/conversations", response_model=Conversation)
+@app.post("/api/conversations", response_class=MsgspecJSONResponse)
 async def create_conversation(agent_id: str, title: Optional[str] = "New Codec Call"):
-    conversation = Conversation(agent_id=agent_id, title=title)
-    await db.conversations.insert_one(conversation.dict())
-    return conversation
+    now = _now_ms()
+    conversation = Conversation(agent_id=agent_id, title=title, created_at=now, updated_at=now)
+    await db.conversations.insert_one(_to_doc(conversation))
+    return MsgspecJSONResponse(conversation)
 
-@app.get("/api/conversations", response_model=List[Conversation])
+@app.get("/api/conversations", response_class=MsgspecJSONResponse)
 async def get_conversations():
-    conversations = await db.conversations.find().sort("updated_at", -1).limit(50).to_list(50)
-    return [Conversation(**conv) for conv in conversations]
+    # List view: the transcripts are fetched per conversation
+    conversations = await db.conversations.find({}, {"messages": 0}).sort("updated_at", -1).limit(50).to_list(50)
+    return MsgspecJSONResponse([_summary_from_doc(conv) for conv in conversations])
 
-@app.get("/api/conversations/{conversation_id}", response_model=Conversation)
+@app.get("/api/conversations/{conversation_id}", response_class=MsgspecJSONResponse)
 async def get_conversation(conversation_id: str):
     conversation = await db.conversations.find_one({"id": conversation_id})
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return Conversation(**conversation)
+    return MsgspecJSONResponse(_conv_from_doc(conversation))
 
 # Message endpoints
-@app.post("/api/conversations/{conversation_id}/messages")
+@app.post("/api/conversations/{conversation_id}/messages", response_class=MsgspecJSONResponse)
 async def send_message(conversation_id: str, role: str, content: str, agent_id: Optional[str] = None):
-    conversation = await db.conversations.find_one({"id": conversation_id})
+    # Only the agent and the recent history are needed, not the full transcript
+    conversation = await db.conversations.find_one(
+        {"id": conversation_id},
+        {"agent_id": 1, "messages": {"$slice": -HISTORY_LIMIT}}
+    )
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
@@ -261,34 +522,36 @@ async def send_message(conversation_id: str, role: str, content: str, agent_id:
         content=content,
         agent_id=agent_id or conversation.get("agent_id")
     )
-    
-    # Add message to conversation
-    await db.conversations.update_one(
-        {"id": conversation_id},
-        {
-            "$push": {"messages": message.dict()},
-            "$set": {"updated_at": datetime.utcnow()}
-        }
-    )
-    
+
+    # The user message and the agent's reply (or error) are appended together
+    # in a single update once the agent call completes
+    new_messages = [message]
+    tokens_used = 0
+
     # If user message, get PicoClaw response
     if role == "user":
-        config = await db.config.find_one({})
+        config = await _get_config_doc()
         if config and config.get("openclaw_token"):
             try:
                 # Decrypt token
-                encrypted_token = config["openclaw_token"]
-                openclaw_token = cipher_suite.decrypt(encrypted_token.encode()).decode()
+                openclaw_token = _decrypt_token(config["openclaw_token"])
 
                 # Get conversation history
                 history = conversation.get("messages", [])
 
+                # Stream the reply to clients as it is generated; the complete
+                # message is persisted and broadcast once the agent finishes
+                async def broadcast_delta(delta: str):
+                    await manager.broadcast(TokenEnvelope("agent_token", conversation_id, delta))
+
                 # Call PicoClaw Agent
                 agent_result = await call_openclaw_agent(
                     token=openclaw_token,
                     agent_id=conversation.get("agent_id"),
                     message=content,
-                    conversation_history=history
+                    conversation_history=history,
+                    on_delta=broadcast_delta,
+                    conversation_id=conversation_id
                 )
 
                 # Extract response
@@ -302,7 +565,7 @@ async def send_message(conversation_id: str, role: str, content: str, agent_id:
                     agent_content += tools_summary
 
                 # Add agent response
-                response_message = Message(
+                new_messages.append(Message(
                     conversation_id=conversation_id,
                     role="agent",
                     content=agent_content,
@@ -312,25 +575,10 @@ async def send_message(conversation_id: str, role: str, content: str, agent_id:
                         "tool_results": tool_results,
                         "iterations": agent_result.get("iterations", 1)
                     }
-                )
+                ))
 
                 # Update conversation metrics
                 tokens_used = usage.get("total_tokens", 0)
-                await db.conversations.update_one(
-                    {"id": conversation_id},
-                    {
-                        "$push": {"messages": response_message.dict()},
-                        "$set": {"updated_at": datetime.utcnow()},
-                        "$inc": {"metrics.tokens_used": tokens_used}
-                    }
-                )
-
-                # Broadcast new message
-                await manager.broadcast({
-                    "type": "new_message",
-                    "conversation_id": conversation_id,
-                    "message": response_message.dict()
-                })
 
             except Exception as e:
                 import traceback
@@ -338,32 +586,40 @@ async def send_message(conversation_id: str, role: str, content: str, agent_id:
                 print(f"PicoClaw Agent error: {error_detail}")
 
                 # Send error message
-                error_message = Message(
+                new_messages.append(Message(
                     conversation_id=conversation_id,
                     role="system",
                     content=f"[ERROR] Agent failed: {str(e)}",
                     agent_id=conversation.get("agent_id")
-                )
-                await db.conversations.update_one(
-                    {"id": conversation_id},
-                    {"$push": {"messages": error_message.dict()}}
-                )
-                await manager.broadcast({
-                    "type": "new_message",
-                    "conversation_id": conversation_id,
-                    "message": error_message.dict()
-                })
-    
-    # Broadcast new message
-    await manager.broadcast({
-        "type": "new_message",
-        "conversation_id": conversation_id,
-        "message": message.dict()
-    })
-    
-    return message
-
-async def call_openclaw_agent(token: str, agent_id: str, message: str, conversation_history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+                ))
+
+    # The newest message's timestamp doubles as the conversation's updated_at;
+    # the dumped messages are reused for the broadcasts below
+    docs = [_message_to_dict(m) for m in new_messages]
+    update = {
+        "$push": {"messages": {"$each": docs}},
+        "$set": {"updated_at": new_messages[-1].timestamp}
+    }
+    if tokens_used:
+        update["$inc"] = {"metrics.tokens_used": tokens_used}
+    await db.conversations.update_one({"id": conversation_id}, update)
+    history = conversation.get("messages")
+    _extend_history(conversation_id, history[-1].get("id") if history else None, new_messages)
+
+    # Broadcast the reply first, then the new message
+    for doc in docs[1:] + docs[:1]:
+        await manager.broadcast(BroadcastEnvelope("new_message", conversation_id, doc))
+
+    return MsgspecJSONResponse(message)
+
+async def call_openclaw_agent(
+    token: str,
+    agent_id: str,
+    message: str,
+    conversation_history: Optional[List[Dict[str, Any]]] = None,
+    on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+    conversation_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Call PicoClaw Agent with user's API key
     Supports Anthropic Claude, OpenAI, and OpenRouter
@@ -378,7 +634,7 @@ async def call_openclaw_agent(token: str, agent_id: str, message: str, conversat
             provider_type, api_key = token.split(":", 1)
 
         # Get agent configuration
-        agent = await db.agents.find_one({"id": agent_id})
+        agent = await _get_agent_doc(agent_id)
         if not agent:
             return {
                 "content": "[ERROR] Agent not found",
@@ -394,32 +650,31 @@ async def call_openclaw_agent(token: str, agent_id: str, message: str, conversat
             api_key=api_key,
             provider_type=provider_type,
             workspace=workspace,
-            brave_api_key=os.getenv("BRAVE_API_KEY")  # Optional web search
+            brave_api_key=os.getenv("BRAVE_API_KEY"),  # Optional web search
+            http_client=HTTP_CLIENT
         )
 
-        # Convert conversation history to PicoClaw format
-        history = []
-        if conversation_history:
-            for msg in conversation_history:
-                if msg["role"] in ["user", "agent", "assistant"]:
-                    role = msg["role"]
-                    if role == "agent":
-                        role = "assistant"
-                    history.append(PicoMessage(
-                        role=role,
-                        content=msg["content"]
-                    ))
+        # Convert conversation history to PicoClaw format (reusing the cached
+        # conversion when the conversation is known)
+        if conversation_id is not None:
+            history = _cached_history(conversation_id, conversation_history or [])
+        else:
+            history = _to_pico_history(conversation_history or [])
 
         # Execute agent
-        response = await picoclaw_agent.chat(
-            user_message=message,
-            history=history,
-            agent_context={
-                "agent_id": agent_id,
-                "agent_name": agent.get("name"),
-                "agent_type": agent.get("type")
-            }
-        )
+        try:
+            response = await picoclaw_agent.chat(
+                user_message=message,
+                history=history,
+                agent_context={
+                    "agent_id": agent_id,
+                    "agent_name": agent.get("name"),
+                    "agent_type": agent.get("type")
+                },
+                on_delta=on_delta
+            )
+        finally:
+            await picoclaw_agent.aclose()
 
         return response
 
@@ -453,8 +708,9 @@ async def save_openclaw_token(token: str):
             if not api_key or not api_key.strip():
                 raise HTTPException(status_code=400, detail="API key cannot be empty")
 
-        # Encrypt token
+        # Encrypt token (and forget previously decrypted ones)
         encrypted_token = cipher_suite.encrypt(token.encode()).decode()
+        _decrypt_token.cache_clear()
 
         existing_config = await db.config.find_one({})
         if existing_config:
@@ -464,7 +720,8 @@ async def save_openclaw_token(token: str):
             )
         else:
             config = UserConfig(openclaw_token=encrypted_token)
-            await db.config.insert_one(config.dict())
+            await db.config.insert_one(_to_doc(config))
+        CONFIG_CACHE.clear()
 
         return {"success": True, "message": "Token secured"}
 
@@ -478,10 +735,10 @@ async def save_openclaw_token(token: str):
 
 @app.get("/api/config")
 async def get_config():
-    config = await db.config.find_one({})
+    config = await _get_config_doc()
     if config:
         # Don't expose the encrypted token
-        config_data = UserConfig(**config)
+        config_data = _config_from_doc(config)
         return {
             "has_token": bool(config_data.openclaw_token),
             "settings": config_data.settings
@@ -491,8 +748,12 @@ async def get_config():
 # Metrics endpoint
 @app.get("/api/metrics", response_model=Metrics)
 async def get_metrics():
-    total_conversations = await db.conversations.count_documents({})
-    active_agents = await db.agents.count_documents({"status": {"$in": ["connected", "busy"]}})
+    # Both counts in flight at once; the unfiltered total comes from collection
+    # metadata rather than a scan
+    total_conversations, active_agents = await asyncio.gather(
+        db.conversations.estimated_document_count(),
+        db.agents.count_documents({"status": {"$in": ACTIVE_AGENT_STATUSES}})
+    )
     
     # Calculate tokens and costs (placeholder logic)
     metrics = Metrics(
@@ -515,12 +776,12 @@ class ScheduledJobCreate(BaseModel):
     enabled: bool = True
 
 @app.get("/api/jobs")
-async def list_jobs():
+async def list_jobs(limit: Optional[int] = None):
     """List all scheduled jobs"""
     scheduler = scheduler_module.job_scheduler
     if not scheduler:
         raise HTTPException(status_code=503, detail="Scheduler not initialized")
-    jobs = await scheduler.list_jobs()
+    jobs = await scheduler.list_jobs(limit=limit)
     return {"jobs": jobs}
 
 @app.get("/api/jobs/{job_id}")
@@ -581,9 +842,13 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             data = await websocket.receive_text()
             # Handle incoming WebSocket messages
-            message_data = json.loads(data)
+            message_data = orjson.loads(data)
             await manager.broadcast(message_data)
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Deregister however the loop ended, so no dead socket stays in the
+        # broadcast fanout
         manager.disconnect(websocket)
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+"""Optional Cython build of the API module.
+
+``pip install -e .`` (or ``python setup.py build_ext --inplace``) compiles
+server.py into an extension module next to the source; Python's import
+system prefers the extension, so ``uvicorn server:app`` picks it up without
+any change. If Cython or a C compiler is unavailable, or compilation fails,
+the install proceeds and the pure-Python module is used.
+"""
+import os
+
+from setuptools import setup
+from setuptools.command.build_ext import build_ext
+
+CYTHON_MODULES = ["server.py"]
+
+
+class OptionalBuildExt(build_ext):
+    """Treat extension build failures as warnings: fall back to pure Python"""
+
+    def run(self):
+        try:
+            super().run()
+        except Exception as e:
+            print(f"WARNING: Cython build skipped, using pure Python: {e}")
+
+    def build_extension(self, ext):
+        try:
+            super().build_extension(ext)
+        except Exception as e:
+            print(f"WARNING: could not compile {ext.name}, using pure Python: {e}")
+
+
+def _extensions():
+    if os.getenv("PICOCLAW_NO_CYTHON"):
+        return []
+    try:
+        from Cython.Build import cythonize
+    except ImportError:
+        return []
+    return cythonize(
+        CYTHON_MODULES,
+        language_level=3,
+        # binding keeps real function signatures, which FastAPI introspects
+        compiler_directives={"boundscheck": False, "wraparound": False, "binding": True},
+        quiet=True,
+    )
+
+
+setup(
+    name="openclaw-backend",
+    version="1.0.0",
+    py_modules=["server", "scheduler"],
+    packages=["picoclaw_agent"],
+    ext_modules=_extensions(),
+    cmdclass={"build_ext": OptionalBuildExt},
+)
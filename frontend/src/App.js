@@ -5,6 +5,7 @@ import Icon from './Icon';
 import { locales } from './locales';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+const wsDecoder = new TextDecoder();
 
 function App() {
   const [agents, setAgents] = useState([]);
@@ -37,6 +38,8 @@ function App() {
   const [codecOpening, setCodecOpening] = useState(true);
   const messagesEndRef = useRef(null);
   const ws = useRef(null);
+  // Current conversation for the WebSocket handler, which is set up once
+  const conversationRef = useRef(null);
   const ringAudioRef = useRef(null);
 
   // Toast notifications
@@ -124,6 +127,10 @@ function App() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
+  useEffect(() => {
+    conversationRef.current = conversation;
+  }, [conversation]);
+
   // Auto scroll to bottom
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -154,15 +161,23 @@ function App() {
   const setupWebSocket = () => {
     const wsUrl = BACKEND_URL.replace('http', 'ws') + '/ws';
     ws.current = new WebSocket(wsUrl);
+    // The backend sends pre-encoded UTF-8 JSON as binary frames
+    ws.current.binaryType = 'arraybuffer';
 
     ws.current.onopen = () => {
       console.log('WebSocket connected');
     };
 
     ws.current.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      if (data.type === 'new_message' && data.conversation_id === conversation?.id) {
-        loadConversation(conversation.id);
+      const text = typeof event.data === 'string' ? event.data : wsDecoder.decode(event.data);
+      const data = JSON.parse(text);
+      const current = conversationRef.current;
+      if (data.type === 'agent_token' && data.conversation_id === current?.id) {
+        // Stream the reply into the typing bubble until the final message lands
+        setTypingMessage(prev => (prev && prev !== '•••' ? prev : '') + data.delta);
+      }
+      if (data.type === 'new_message' && data.conversation_id === current?.id) {
+        loadConversation(current.id);
       }
       if (data.type === 'agent_status') {
         loadAgents();
@@ -303,8 +318,8 @@ function App() {
     if (!hasToken) {
       showToast('No API token found. Sending message via local fallback or waiting for token.', 'warning');
       // We will allow adding a local message and a system warning
-      const fakeUserMessage = { role: 'user', content: inputMessage, timestamp: new Date().toISOString() };
-      const tokenWarningMessage = { role: 'system', content: 'SYSTEM WARNING: No API token configured. Please click the TOKEN button to set up your AI provider to receive external responses.', timestamp: new Date().toISOString() };
+      const fakeUserMessage = { role: 'user', content: inputMessage, timestamp: Date.now() };
+      const tokenWarningMessage = { role: 'system', content: 'SYSTEM WARNING: No API token configured. Please click the TOKEN button to set up your AI provider to receive external responses.', timestamp: Date.now() };
       setMessages(prev => [...prev, fakeUserMessage, tokenWarningMessage]);
       setInputMessage('');
       return;
@@ -320,7 +335,7 @@ function App() {
         id: Date.now().toString(),
         role: 'user',
         content: userMessage,
-        timestamp: new Date().toISOString()
+        timestamp: Date.now()
       };
       setMessages(prev => [...prev, tempMsg]);
 